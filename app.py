@@ -2,75 +2,188 @@
 
 import os
 import io
+import time
+import zipfile
 from datetime import datetime
 
-from flask import Flask, render_template, request, redirect, url_for, send_file
-from flask_sqlalchemy import SQLAlchemy
+import click
+from flask import (Flask, Response, render_template, request, redirect, url_for, send_file, abort,
+                   jsonify, stream_with_context)
+from sqlalchemy import event, tuple_
+from werkzeug.utils import secure_filename
 
-# --- ReportLab Imports ---
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from models import db, RentEntry, init_db
+from database import init_database, run_write
+from jobs import QueueFull, enqueue, jobs, queue_full_response
+from ledger_io import FORMATS, export_rows, import_rows, read_rows
+from meters import forget_entry, latest_reading, meter_routes, record_entry
+from metrics import init_metrics, observe_render, timed_render
+from pdf_cache import PdfCache, cache_key
+from reports import reports
+from tariffs import calculate_charges, current_book, entry_invoice, tariff_routes
+from invoice import (invoice_filename, render_invoice, render_invoices,
+                     render_pool, render_stream)
 
 # --- App and Database Configuration ---
 app = Flask(__name__)
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'rent.db')
+# DATABASE_URL lets benchmarks and deployments point at another database file
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'rent.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-
-# --- Database Model Definition ---
-# UPDATED: Changed 'water' to 'water_fill_count' and added 'water_cost'
-class RentEntry(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    tenant_name = db.Column(db.String(100), nullable=False)
-    month = db.Column(db.String(50), nullable=False)
-    entry_date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
-    rent = db.Column(db.Float, nullable=False, default=0)
-   
-    # New: Store the count, then calculate the cost
-    water_fill_count = db.Column(db.Integer, nullable=False, default=0)
-    water = db.Column(db.Float, nullable=False, default=0) # This will store the CALCULATED water cost
-
-    waste = db.Column(db.Float, nullable=False, default=0)
-    
-    electricity_previous_reading = db.Column(db.Float, nullable=False, default=0)
-    electricity_present_reading = db.Column(db.Float, nullable=False, default=0)
-    electricity = db.Column(db.Float, nullable=False, default=0) 
-    
-    repair = db.Column(db.Float, nullable=False, default=0)
-    misc = db.Column(db.Float, nullable=False, default=0)
-    
-    # Calculate total on the fly
-    @property
-    def total(self):
-        return self.rent + self.water + self.waste + self.electricity + self.repair + self.misc
-
-    def __repr__(self):
-        return f'<RentEntry for {self.tenant_name}>'
+# Processes used to render invoices for the bulk PDF endpoint. Every web
+# worker has its own pool, so under Gunicorn post_fork() (gunicorn.conf.py)
+# splits the CPUs between the workers unless PDF_RENDER_WORKERS is set.
+app.config['PDF_RENDER_WORKERS'] = int(os.environ.get('PDF_RENDER_WORKERS', os.cpu_count() or 1))
+app.config['BULK_PDF_MAX_INVOICES'] = 5000
+# Rendered invoice cache: an in-process LRU plus a directory shared by workers
+app.config['PDF_CACHE_DIR'] = os.environ.get('PDF_CACHE_DIR', os.path.join(app.instance_path, 'pdf_cache'))
+app.config['PDF_CACHE_MEMORY_BYTES'] = 32 * 1024 * 1024
+app.config['PDF_CACHE_DISK_BYTES'] = 512 * 1024 * 1024
+# Background rendering (see jobs.py). With PDF_RENDER_ASYNC=1, generate_pdf
+# queues uncached invoices for `flask jobs worker` instead of rendering them
+# inside the request.
+app.config['PDF_RENDER_ASYNC'] = os.environ.get('PDF_RENDER_ASYNC', '0') == '1'
+app.config['RENDER_QUEUE_MAX_QUEUED'] = int(os.environ.get('RENDER_QUEUE_MAX_QUEUED', 2000))
+app.config['RENDER_JOB_TIMEOUT'] = 300            # seconds before a running job is presumed dead
+app.config['RENDER_JOB_MAX_ATTEMPTS'] = 3
+app.config['RENDER_JOB_RETENTION_DAYS'] = 7
+init_database(app)
+pdf_cache = PdfCache(app.config['PDF_CACHE_DIR'],
+                     app.config['PDF_CACHE_MEMORY_BYTES'],
+                     app.config['PDF_CACHE_DISK_BYTES'])
+app.extensions['pdf_cache'] = pdf_cache
+with app.app_context():
+    init_metrics(app, db.engine, pdf_cache)
+app.register_blueprint(reports)
+app.register_blueprint(jobs)
+app.register_blueprint(tariff_routes)
+app.register_blueprint(meter_routes)
+
+# Free cached invoices as soon as their entry changes. Bulk query.update() /
+# query.delete() skip these events, which is safe: cache keys are content
+# hashes, so stale PDFs are never served and just age out of the cache.
+@event.listens_for(RentEntry, 'after_update')
+@event.listens_for(RentEntry, 'after_delete')
+def invalidate_cached_invoice(mapper, connection, target):
+    pdf_cache.invalidate(target.id)
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the database tables and indexes."""
+    init_db()
+    print('Database initialised.')
+
+
+@app.cli.command('import-ledger')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per transaction.')
+def import_ledger_command(path, batch_size):
+    """Import RentEntry rows from a .csv or .jsonl file."""
+    fmt = path.rsplit('.', 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise click.BadParameter(f"file must end in {' or '.join('.' + f for f in FORMATS)}")
+    with open(path, 'rb') as f:
+        result = import_rows(read_rows(f, fmt), batch_size=batch_size)
+    for line, message in result.errors:
+        print(f'line {line}: {message}')
+    print(f'Imported {result.inserted} rows, rejected {result.rejected} '
+          f'({result.rows_per_sec:,.0f} rows/sec).')
+    if not result.complete:
+        raise click.ClickException('The file could not be read to the end; see the last error above.')
+
+
+@app.cli.command('export-ledger')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+def export_ledger_command(path):
+    """Export every RentEntry to a .csv or .jsonl file."""
+    fmt = path.rsplit('.', 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise click.BadParameter(f"file must end in {' or '.join('.' + f for f in FORMATS)}")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for chunk in export_rows(fmt):
+            f.write(chunk)
+    print(f'Exported ledger to {path}.')
+
+
+# --- Ledger Pagination ---
+PER_PAGE_DEFAULT = 50
+PER_PAGE_MAX = 200
+
+def parse_cursor(value):
+    """Turn a '2024-05-01_42' cursor back into (entry_date, id), or None if absent."""
+    if not value:
+        return None
+    try:
+        date_part, id_part = value.rsplit('_', 1)
+        return datetime.strptime(date_part, '%Y-%m-%d').date(), int(id_part)
+    except ValueError:
+        abort(400, description=f'Invalid page cursor: {value!r}')
+
+def ledger_page(tenant=None, month=None, before=None, after=None, per_page=PER_PAGE_DEFAULT):
+    """Return one page of entries, newest first, plus whether newer/older pages exist.
+
+    Uses keyset pagination on (entry_date, id) instead of OFFSET, so every page
+    is a bounded range scan on one of the RentEntry indexes no matter how deep
+    into the ledger it is or how large the table grows.
+    """
+    query = RentEntry.query
+    if tenant:
+        query = query.filter(RentEntry.tenant_name == tenant)
+    if month:
+        query = query.filter(RentEntry.month == month)
+
+    key = tuple_(RentEntry.entry_date, RentEntry.id)
+    if after:
+        # Walking back towards newer rows: scan ascending, then flip the page.
+        rows = (query.filter(key > after)
+                .order_by(RentEntry.entry_date.asc(), RentEntry.id.asc())
+                .limit(per_page + 1).all())
+        has_newer = len(rows) > per_page
+        entries = rows[:per_page][::-1]
+        has_older = True
+    else:
+        if before:
+            query = query.filter(key < before)
+        rows = (query.order_by(RentEntry.entry_date.desc(), RentEntry.id.desc())
+                .limit(per_page + 1).all())
+        has_older = len(rows) > per_page
+        entries = rows[:per_page]
+        has_newer = before is not None
+
+    return entries, has_newer and bool(entries), has_older and bool(entries)
 
 # --- Web Routes ---
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        # --- UPDATED: Water Calculation Logic ---
+        entry_date = datetime.strptime(request.form['entry_date'], '%Y-%m-%d').date()
+        # Stripped like imported names, so 'Ram ' and 'Ram' are one tenant and one meter
+        tenant_name = request.form['tenant_name'].strip()
+        if not tenant_name:
+            abort(400, description='Tenant name is required')
         water_fill_count = int(request.form.get('water_fill_count') or 0)
-        water_cost = water_fill_count * 250 # Price is Nrs. 250 per fill
-
-        previous_reading = float(request.form.get('electricity_previous_reading') or 0)
+        # Left blank, the previous reading carries over from the tenant's meter.
+        # Without one (a new tenant, meters never backfilled, or an entry dated
+        # before the meter's latest reading) it has to be typed in: assuming 0,
+        # or a later reading, would bill the wrong number of units.
+        previous_reading = request.form.get('electricity_previous_reading', '').strip()
+        if previous_reading:
+            previous_reading = float(previous_reading)
+        else:
+            previous_reading = latest_reading(tenant_name, entry_date)
+            if previous_reading is None:
+                abort(400, description=f'Previous reading required: no reading on record for '
+                                       f'{tenant_name} carries over to {entry_date}')
         present_reading = float(request.form.get('electricity_present_reading') or 0)
-        units_consumed = 0
-        if present_reading >= previous_reading:
-            units_consumed = present_reading - previous_reading
-        electricity_cost = units_consumed * 13 # Price is Nrs. 13 per unit
+        water_cost, electricity_cost = calculate_charges(
+            entry_date, water_fill_count, previous_reading, present_reading)
 
         new_entry = RentEntry(
-            tenant_name=request.form['tenant_name'],
+            tenant_name=tenant_name,
              month = request.form['month'],
-            entry_date=datetime.strptime(request.form['entry_date'], '%Y-%m-%d').date(),
+            entry_date=entry_date,
            
             rent=float(request.form.get('rent') or 0),
             
@@ -84,171 +197,200 @@ def index():
             repair=float(request.form.get('repair') or 0),
             misc=float(request.form.get('misc') or 0)
         )
-        db.session.add(new_entry)
-        db.session.commit()
+
+        def add():
+            db.session.add(new_entry)
+            return record_entry(new_entry)
+
+        alert = run_write(add)
+        if alert:
+            app.logger.warning('Unusual electricity usage for %s: %.0f units, usually %.0f (z=%.1f)',
+                               new_entry.tenant_name, alert.units, alert.expected_units, alert.z_score)
         return redirect(url_for('index'))
 
-    all_entries = RentEntry.query.order_by(RentEntry.entry_date.desc()).all()
-    return render_template('index.html', entries=all_entries)
+    tenant = request.args.get('tenant', '').strip()
+    month = request.args.get('month', '').strip()
+    per_page = request.args.get('per_page', PER_PAGE_DEFAULT, type=int)
+    per_page = min(max(per_page, 1), PER_PAGE_MAX)
+
+    entries, has_newer, has_older = ledger_page(
+        tenant=tenant,
+        month=month,
+        before=parse_cursor(request.args.get('before')),
+        after=parse_cursor(request.args.get('after')),
+        per_page=per_page,
+    )
+
+    # Only non-default filters are carried over into the pagination links
+    filters = {k: v for k, v in (('tenant', tenant), ('month', month)) if v}
+    if per_page != PER_PAGE_DEFAULT:
+        filters['per_page'] = per_page
+    newer_url = url_for('index', after=entries[0].cursor, **filters) if has_newer else None
+    older_url = url_for('index', before=entries[-1].cursor, **filters) if has_older else None
+
+    book = current_book()
+    today = datetime.now().date()
+    tariffs = {utility: book.tariff(utility, today) for utility in ('water', 'electricity')}
+    return render_template('index.html', entries=entries, tenant=tenant, month=month, tariffs=tariffs,
+                           newer_url=newer_url, older_url=older_url)
+
+@app.route('/import', methods=['POST'])
+def import_ledger():
+    """Bulk import an uploaded CSV or JSON Lines file; responds with a JSON summary."""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        abort(400, description='Upload a file in the "file" field')
+    fmt = request.form.get('format') or upload.filename.rsplit('.', 1)[-1].lower()
+    if fmt not in FORMATS:
+        abort(400, description=f"format must be one of: {', '.join(FORMATS)}")
+
+    result = import_rows(read_rows(upload.stream, fmt))
+    app.logger.info('Import: %d rows inserted, %d rejected (%.0f rows/sec)',
+                    result.inserted, result.rejected, result.rows_per_sec)
+    return jsonify(result.to_dict())
+
+@app.route('/export')
+def export_ledger():
+    """Stream the ledger (optionally one tenant or month) as CSV or JSON Lines."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400, description=f"format must be one of: {', '.join(FORMATS)}")
+    tenant = request.args.get('tenant', '').strip()
+    month = request.args.get('month', '').strip()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(export_rows(fmt, tenant=tenant, month=month)),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=rent_ledger.{fmt}'})
 
 @app.route('/delete/<int:entry_id>', methods=['POST'])
 def delete_entry(entry_id):
-    entry_to_delete = RentEntry.query.get_or_404(entry_id)
-    db.session.delete(entry_to_delete)
-    db.session.commit()
-    return redirect(url_for('index'))
+    def delete():
+        entry_to_delete = RentEntry.query.get_or_404(entry_id)
+        db.session.delete(entry_to_delete)
+        forget_entry(entry_to_delete)
 
-# In app.py
-
-# ... (keep all your other imports and code) ...
+    run_write(delete)
+    return redirect(url_for('index'))
 
 @app.route('/generate_pdf/<int:entry_id>')
 def generate_pdf(entry_id):
     entry = RentEntry.query.get_or_404(entry_id)
-    
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
-    # --- Register Fonts ---
-    font_path = "DejaVuSans.ttf"
-    main_font = 'Helvetica'
-    
-    if os.path.exists(font_path):
+    data = entry_invoice(entry, current_book())
+    key = cache_key(data)
+
+    # The client already has this exact invoice
+    if key in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{key}"'})
+
+    pdf = pdf_cache.get(entry.id, key)
+    if pdf is None and app.config['PDF_RENDER_ASYNC']:
+        # Keep the web worker free: hand the render to the job queue and let
+        # the browser wait on the download URL, which refreshes until ready
         try:
-            pdfmetrics.registerFont(TTFont('DejaVu', font_path))
-            pdfmetrics.registerFont(TTFont('DejaVu-Bold', font_path))
-            pdfmetrics.registerFont(TTFont('DejaVu-Italic', font_path))
-            pdfmetrics.registerFont(TTFont('DejaVu-BoldItalic', font_path))
-            main_font = 'DejaVu'
-        except Exception as e:
-            app.logger.error(f"ReportLab: Error registering DejaVuSans.ttf: {e}. Falling back to Helvetica.")
-            main_font = 'Helvetica' 
-    else:
-        app.logger.error("ReportLab: DejaVuSans.ttf not found. Using Helvetica.")
-        main_font = 'Helvetica' 
-
-    # --- PDF Content Drawing ---
-    
-    logo_path = "static/logo.jpeg"
-    logo_height_points = 0.8 * inch # Define desired height for the logo (0.8 inches)
-    logo_width_points = 0.8 * inch # Define desired width for the logo (0.8 inches)
-
-    # --- NEW: DRAW THE LOGO WITH CORRECTED POSITIONING ---
-    if os.path.exists(logo_path):
-        # Calculate Y position: height - top_margin - logo_height
-        # This places the TOP of the logo at (height - top_margin)
-        top_margin = 0.75 * inch 
-        logo_y_position = height - top_margin - logo_height_points
-        
-        # Calculate X position to center it (optional, you can keep it left if preferred)
-        # For left alignment, use x=1*inch
-        logo_x_position = (width - logo_width_points) / 2.0 # Center horizontally
-
-        p.drawImage(logo_path, 
-                    x=logo_x_position, # Centered X position
-                    y=logo_y_position, # Corrected Y position for the top alignment
-                    width=logo_width_points, 
-                    height=logo_height_points, # Specify height explicitly for better control
-                    preserveAspectRatio=True, 
-                    mask='auto')
-        
-        # Adjust vertical spacing after the logo
-        y_offset_after_logo = top_margin + logo_height_points + 0.2*inch # Space after logo
-    else:
-        y_offset_after_logo = 1.0 * inch # Default top margin if no logo
-
-    # Invoice Title (adjusted to be below the logo)
-    p.setFont(f"{main_font}-Bold", 16)
-    p.drawCentredString(width / 2.0, height - y_offset_after_logo, "Aryal Homes - Rent Invoice")
-
-    # Start main content further down to avoid overlapping with logo/title
-    start_content_y = height - y_offset_after_logo - 0.5*inch # Adjust this value as needed
-
-    p.setFont(main_font, 11)
-    p.drawString(1*inch, start_content_y, f"Tenant Name: {entry.tenant_name}")
-    p.drawString(1*inch, start_content_y- 0.2*inch, f"Month-Year: {entry.month}")
-    p.drawString(1*inch, start_content_y - 0.4*inch, f"Invoice Date: {entry.entry_date.strftime('%B %d, %Y')}")   
-   
-    # --- The rest of the function (adjust y_position start) ---
-    y_position = start_content_y - 0.7*inch # Adjusted start position for table
-
-    table_left_margin = 1*inch
-    table_right_margin = width - 1*inch
-    
-    p.setFont(f"{main_font}-Bold", 12)
-    p.drawString(table_left_margin, y_position, "Category")
-    p.drawRightString(table_right_margin, y_position, "Amount (NRS)")
-    y_position -= 0.2*inch
-    p.line(table_left_margin, y_position, table_right_margin, y_position)
-    y_position -= 0.25*inch
-    
-    p.setFont(main_font, 11)
-    charges = [("Rent", entry.rent)]
-    for category, amount in charges:
-        p.drawString(table_left_margin, y_position, category)
-        p.drawRightString(table_right_margin, y_position, f"{amount:,.2f}")
-        y_position -= 0.25*inch
-    
-    p.setFont(f"{main_font}-Bold", 11)
-    p.drawString(table_left_margin, y_position, "Water Details")
-    y_position -= 0.25*inch
-    p.setFont(main_font, 10)
-    p.drawString(table_left_margin + 0.2*inch, y_position, f"Times Filled: {entry.water_fill_count} @ NRS 250.00/fill")
-    y_position -= 0.25*inch
-    p.setFont(main_font, 11)
-    p.drawString(table_left_margin, y_position, "Water Cost")
-    p.drawRightString(table_right_margin, y_position, f"{entry.water:,.2f}")
-    y_position -= 0.25*inch
-
-    units_consumed = entry.electricity_present_reading - entry.electricity_previous_reading
-    p.setFont(f"{main_font}-Bold", 11)
-    p.drawString(table_left_margin, y_position, "Electricity Details")
-    y_position -= 0.25*inch
-    p.setFont(main_font, 10)
-    p.drawString(table_left_margin + 0.2*inch, y_position, f"Present Reading: {entry.electricity_present_reading:,.2f}")
-    y_position -= 0.20*inch
-    p.drawString(table_left_margin + 0.2*inch, y_position, f"Previous Reading: {entry.electricity_previous_reading:,.2f}")
-    y_position -= 0.20*inch
-    p.drawString(table_left_margin + 0.2*inch, y_position, f"Units Consumed: {units_consumed:,.2f} units @ NRS 13.00/unit")
-    y_position -= 0.25*inch
-    p.setFont(main_font, 11)
-    p.drawString(table_left_margin, y_position, "Electricity Cost")
-    p.drawRightString(table_right_margin, y_position, f"{entry.electricity:,.2f}")
-    y_position -= 0.25*inch
-
-    other_charges = [
-        ("Waste Management", entry.waste),
-        ("Repair Costs", entry.repair),
-        ("Miscellaneous", entry.misc),
-    ]
-    for category, amount in other_charges:
-        p.drawString(table_left_margin, y_position, category)
-        p.drawRightString(table_right_margin, y_position, f"{amount:,.2f}")
-        y_position -= 0.25*inch
-    
-    y_position -= 0.2*inch
-    p.line(table_left_margin, y_position, table_right_margin, y_position)
-    y_position -= 0.25*inch
-    p.setFont(f"{main_font}-Bold", 12)
-    p.drawString(table_left_margin, y_position, "Total Amount Due")
-    p.drawRightString(table_right_margin, y_position, f"{entry.total:,.2f}")
-
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    
-    filename = f'invoice_{entry.tenant_name}_{entry.entry_date}.pdf'
-    
-    return send_file(
-        buffer,
+            job, = enqueue([entry])
+        except QueueFull:
+            return queue_full_response()
+        return redirect(url_for('jobs.download', job_id=job.id), code=303)
+    if pdf is None:
+        pdf = timed_render('sync', render_invoice, data)
+        pdf_cache.put(entry.id, key, pdf)
+
+    response = send_file(
+        io.BytesIO(pdf),
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=filename
+        download_name=invoice_filename(entry),
+        etag=key
     )
+    # Let browsers keep the file but revalidate it on every download
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/generate_pdf/bulk', methods=['GET', 'POST'])
+def generate_pdf_bulk():
+    """Render many invoices at once: ?month=<month> or ?ids=1,2,3, as a ZIP or one PDF.
+
+    format=zip (default) renders on the process pool and streams each invoice
+    into the archive as soon as it is ready; format=pdf returns a single merged
+    document with one invoice per page.
+    """
+    values = request.values
+    month = values.get('month', '').strip()
+    try:
+        ids = [int(i) for i in values.get('ids', '').replace(' ', '').split(',') if i]
+    except ValueError:
+        abort(400, description='ids must be a comma-separated list of entry ids')
+    output = values.get('format', 'zip')
+    if output not in ('zip', 'pdf'):
+        abort(400, description="format must be 'zip' or 'pdf'")
+    if not month and not ids:
+        abort(400, description='Pass a month or a comma-separated list of ids')
+
+    query = RentEntry.query
+    query = query.filter(RentEntry.month == month) if month else query.filter(RentEntry.id.in_(ids))
+    # Counted first, so an oversized request is refused before any rows are loaded
+    count = query.count()
+    if not count:
+        abort(404)
+    if count > app.config['BULK_PDF_MAX_INVOICES']:
+        abort(413, description=f"At most {app.config['BULK_PDF_MAX_INVOICES']} invoices per request")
+    book = current_book()
+    entries = [entry_invoice(entry, book) for entry in
+               query.order_by(RentEntry.tenant_name, RentEntry.entry_date, RentEntry.id).all()]
+
+    label = secure_filename(month) if month else f'{len(entries)}_entries'
+    pool = render_pool(app.config['PDF_RENDER_WORKERS'])
+    started = time.perf_counter()
+
+    if output == 'pdf':
+        pdf = timed_render('bulk_merged', lambda: pool.submit(render_invoices, entries).result())
+        _log_bulk_throughput(len(entries), started)
+        return send_file(io.BytesIO(pdf), mimetype='application/pdf', as_attachment=True,
+                         download_name=f'invoices_{label}.pdf')
+
+    def generate():
+        stream = ZipChunkStream()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for entry, pdf, seconds in render_stream(entries, pool, window=2 * app.config['PDF_RENDER_WORKERS']):
+                observe_render('bulk', seconds, pdf)
+                archive.writestr(f'{entry.id}_{invoice_filename(entry)}', pdf)
+                yield stream.drain()
+        yield stream.drain()
+        _log_bulk_throughput(len(entries), started)
+
+    return Response(generate(), mimetype='application/zip', headers={
+        'Content-Disposition': f'attachment; filename=invoices_{label}.zip'})
+
+def _log_bulk_throughput(count, started):
+    elapsed = time.perf_counter() - started
+    app.logger.info('Bulk PDF: rendered %d invoices in %.2fs (%.1f invoices/sec)',
+                    count, elapsed, count / elapsed if elapsed else 0.0)
+
+class ZipChunkStream:
+    """Write-only sink for zipfile that hands back what was written since the last drain.
+
+    It has no tell()/seek(), so ZipFile falls back to streaming mode (data
+    descriptors after each member) and never needs the whole archive at once.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
 
 # --- Main Execution ---
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
     app.run(debug=True)
\ No newline at end of file
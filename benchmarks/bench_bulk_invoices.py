@@ -0,0 +1,63 @@
+# benchmarks/bench_bulk_invoices.py
+"""Invoice throughput: one request per invoice vs. the bulk endpoint.
+
+    python -m benchmarks.bench_bulk_invoices --invoices 200
+"""
+
+import argparse
+import io
+import os
+import time
+import zipfile
+
+from benchmarks.common import seed_entries, use_temp_database
+
+
+def invoices_per_sec(count, fn):
+    started = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=200)
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    # A fresh invoice cache, so one_at_a_time() really renders every invoice
+    os.environ['PDF_CACHE_DIR'] = os.path.join(os.path.dirname(db_path), 'pdf_cache')
+    import app as rent_app
+    from app import app, db, RentEntry
+
+    with app.app_context():
+        rent_app.init_db()
+        seed_entries(db, RentEntry, 0, args.invoices, args.invoices)
+        ids = [entry_id for (entry_id,) in db.session.query(RentEntry.id)]
+
+    client = app.test_client()
+    id_list = ','.join(map(str, ids))
+    # Start the render pool outside the timed sections
+    client.get(f'/generate_pdf/bulk?ids={ids[0]}&format=pdf')
+
+    def one_at_a_time():
+        for entry_id in ids:
+            assert client.get(f'/generate_pdf/{entry_id}').status_code == 200
+
+    def bulk_zip():
+        archive = zipfile.ZipFile(io.BytesIO(client.get(f'/generate_pdf/bulk?ids={id_list}').get_data()))
+        assert len(archive.namelist()) == len(ids)
+
+    def bulk_pdf():
+        assert client.get(f'/generate_pdf/bulk?ids={id_list}&format=pdf').status_code == 200
+
+    print(f"{'workers':<24} {app.config['PDF_RENDER_WORKERS']}")
+    baseline = invoices_per_sec(len(ids), one_at_a_time)
+    print(f"{'one at a time':<24} {baseline:8.1f} invoices/sec")
+    for name, fn in (('bulk zip (process pool)', bulk_zip), ('bulk merged pdf', bulk_pdf)):
+        rate = invoices_per_sec(len(ids), fn)
+        print(f'{name:<24} {rate:8.1f} invoices/sec  ({rate / baseline:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
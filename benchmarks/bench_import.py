@@ -0,0 +1,64 @@
+# benchmarks/bench_import.py
+"""Bulk CSV import rate, compared with one ORM insert and commit per row.
+
+    python -m benchmarks.bench_import --rows 1000000
+"""
+
+import argparse
+import csv
+import os
+import time
+
+from benchmarks.common import synthetic_rows, use_temp_database
+
+IMPORT_COLUMNS = ['tenant_name', 'month', 'entry_date', 'rent', 'water_fill_count', 'waste',
+                  'electricity_previous_reading', 'electricity_present_reading', 'repair', 'misc']
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, IMPORT_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(synthetic_rows(0, rows, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--baseline-rows', type=int, default=2000,
+                        help='rows for the one-commit-per-row comparison')
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    from app import app
+    from ledger_io import export_rows, import_rows, read_rows
+    from models import db, RentEntry, init_db
+
+    csv_path = os.path.join(os.path.dirname(db_path), 'ledger.csv')
+    write_csv(csv_path, args.rows)
+
+    with app.app_context():
+        init_db()
+        with open(csv_path, 'rb') as f:
+            result = import_rows(read_rows(f, 'csv'), batch_size=args.batch_size)
+        assert result.inserted == args.rows, result.to_dict()
+        print(f'bulk import    {result.inserted:>10,} rows  {result.elapsed:7.2f} s  '
+              f'{result.rows_per_sec:>10,.0f} rows/sec')
+
+        started = time.perf_counter()
+        exported = sum(chunk.count('\n') for chunk in export_rows('csv')) - 1
+        elapsed = time.perf_counter() - started
+        print(f'export         {exported:>10,} rows  {elapsed:7.2f} s  {exported / elapsed:>10,.0f} rows/sec')
+
+        started = time.perf_counter()
+        for row in synthetic_rows(0, args.baseline_rows, args.baseline_rows):
+            db.session.add(RentEntry(**row))
+            db.session.commit()
+        elapsed = time.perf_counter() - started
+        print(f'row at a time  {args.baseline_rows:>10,} rows  {elapsed:7.2f} s  '
+              f'{args.baseline_rows / elapsed:>10,.0f} rows/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_index_pagination.py
+"""Page latency of the index() ledger view as the RentEntry table grows.
+
+    python -m benchmarks.bench_index_pagination                # 10k, 100k, 1M rows
+    python -m benchmarks.bench_index_pagination --rows 10000 --legacy
+
+Every size is measured in its own subprocess against a fresh database. With
+keyset pagination the first page, a page deep in the ledger and the filtered
+pages should all stay flat; --legacy also times the old load-everything query.
+"""
+
+import argparse
+import subprocess
+import sys
+
+from benchmarks.common import TENANT_COUNT, median_ms, seed_entries, use_temp_database
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def run_single(rows, legacy):
+    use_temp_database()
+    import app as rent_app
+    from app import app, db, RentEntry
+
+    with app.app_context():
+        rent_app.init_db()
+        seed_entries(db, RentEntry, 0, rows, rows)
+
+        # A cursor ~90% of the way into the ledger, i.e. a very deep page
+        deep = (RentEntry.query.order_by(RentEntry.entry_date.asc(), RentEntry.id.asc())
+                .offset(rows // 10).first())
+        sample = RentEntry.query.order_by(RentEntry.id.desc()).first()
+
+    client = app.test_client()
+    scenarios = {
+        'first page': '/',
+        'deep page': f'/?before={deep.cursor}',
+        'tenant filter': f'/?tenant=Tenant%20{TENANT_COUNT // 2:03d}',
+        'month filter': f'/?month={sample.month.replace(" ", "%20")}',
+    }
+
+    results = {}
+    for name, url in scenarios.items():
+        assert client.get(url).status_code == 200, url
+        results[name] = median_ms(lambda: client.get(url))
+
+    if legacy:
+        def load_everything():
+            with app.app_context():
+                RentEntry.query.order_by(RentEntry.entry_date.desc()).all()
+        results['legacy .all()'] = median_ms(load_everything, repeat=3)
+
+    for name, ms in results.items():
+        print(f'{rows:>10,} rows  {name:<15} {ms:9.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--legacy', action='store_true',
+                        help='also time the old unpaginated query')
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.rows[0], args.legacy)
+        return
+
+    for rows in args.rows:
+        cmd = [sys.executable, '-m', 'benchmarks.bench_index_pagination',
+               '--single', '--rows', str(rows)]
+        if args.legacy:
+            cmd.append('--legacy')
+        subprocess.run(cmd, check=True)
+
+
+if __name__ == '__main__':
+    main()
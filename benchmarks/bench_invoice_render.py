@@ -0,0 +1,61 @@
+# benchmarks/bench_invoice_render.py
+"""Per-invoice render latency with cold vs. warm rendering resources.
+
+    python -m benchmarks.bench_invoice_render
+
+"cold" clears the cached fonts and logo and turns ASCII85 image encoding back
+on before every invoice, which is what each request paid before resources
+were cached per process (it still parses the TTF once rather than four
+times, so it understates the old cost). "warm" is the steady state of a
+warmed-up worker.
+"""
+
+import argparse
+from datetime import date
+
+from reportlab import rl_config
+
+import invoice
+from benchmarks.common import median_ms
+
+SAMPLE = invoice.InvoiceData(
+    id=1, tenant_name='Tenant 001', month='May 2024', entry_date=date(2024, 5, 1),
+    rent=15000.0, water_fill_count=3, water=750.0, waste=200.0,
+    electricity_previous_reading=1200.0, electricity_present_reading=1310.0,
+    electricity=1430.0, repair=0.0, misc=0.0, total=17380.0,
+    water_rate='NRS 250.00/fill', electricity_rate='NRS 13.00/unit',
+)
+
+
+def cold_render():
+    invoice._main_font = None
+    invoice._logo = None
+    rl_config.useA85 = 1
+    invoice.render_invoice(SAMPLE)
+
+
+def warm_render():
+    invoice.render_invoice(SAMPLE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--logo', help='logo to draw instead of invoice.LOGO_PATH')
+    args = parser.parse_args()
+    if args.logo:
+        invoice.LOGO_PATH = args.logo
+
+    cold = median_ms(cold_render, args.repeat)
+
+    rl_config.useA85 = 0
+    invoice.warm_up()
+    warm = median_ms(warm_render, args.repeat)
+
+    print(f'logo drawn: {invoice.load_logo() is not None}')
+    print(f'cold  {cold:8.2f} ms/invoice')
+    print(f'warm  {warm:8.2f} ms/invoice  ({cold / warm:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# benchmarks/bench_meters.py
+"""Meter backfill rate and previous-reading lookup latency.
+
+    python -m benchmarks.bench_meters --tenants 1000 --months 120
+
+The lookup is what the entry form and index() POST use to fill in the
+previous reading. It is two unique-index probes, so it should not change
+with the size of the ledger.
+"""
+
+import argparse
+
+from benchmarks.common import median_ms, seed_ledger, use_temp_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', type=int, default=1000)
+    parser.add_argument('--months', type=int, default=120)
+    args = parser.parse_args()
+
+    use_temp_database()
+    from app import app
+    from meters import backfill, latest_reading
+    from models import db, RentEntry, init_db
+
+    with app.app_context():
+        init_db()
+        seed_ledger(db, RentEntry, args.tenants, args.months)
+
+        scanned, tenants, alerts, seconds = backfill()
+        print(f'backfill      {scanned:>10,} rows  {tenants:>6,} tenants  {alerts:>6,} alerts  '
+              f'{seconds:7.2f} s  {scanned / seconds:>10,.0f} rows/sec')
+
+        name = f'Tenant {args.tenants // 2:04d}'
+        newest = (db.select(RentEntry.electricity_present_reading)
+                  .where(RentEntry.tenant_name == name)
+                  .order_by(RentEntry.entry_date.desc(), RentEntry.id.desc()).limit(1))
+        # The meter must agree with the tenant's newest entry
+        assert latest_reading(name) == db.session.execute(newest).scalar()
+        print(f'meter lookup  {median_ms(lambda: latest_reading(name), repeat=200):9.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/bench_reports.py
+"""SQL GROUP BY reports vs. hydrating every RentEntry and summing in Python.
+
+    python -m benchmarks.bench_reports --rows 200000
+"""
+
+import argparse
+from collections import defaultdict
+
+from benchmarks.common import median_ms, seed_entries, use_temp_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    use_temp_database()
+    from app import app
+    from models import db, RentEntry, init_db
+
+    with app.app_context():
+        init_db()
+        seed_entries(db, RentEntry, 0, args.rows, args.rows)
+
+    def hydrate(summarise):
+        def run():
+            with app.app_context():
+                totals = defaultdict(float)
+                for entry in RentEntry.query.all():
+                    summarise(totals, entry)
+        return run
+
+    orm = {
+        'periods': hydrate(lambda t, e: t.__setitem__(e.entry_date.strftime('%Y-%m'),
+                                                      t[e.entry_date.strftime('%Y-%m')] + e.total)),
+        'tenants': hydrate(lambda t, e: t.__setitem__(e.tenant_name, t[e.tenant_name] + e.total)),
+        'categories': hydrate(lambda t, e: [t.__setitem__(c, t[c] + getattr(e, c))
+                                            for c in ('rent', 'water', 'waste', 'electricity', 'repair', 'misc')]),
+        'consumption': hydrate(lambda t, e: t.__setitem__((e.entry_date.strftime('%Y-%m'), e.tenant_name),
+                                                          t[(e.entry_date.strftime('%Y-%m'), e.tenant_name)]
+                                                          + e.units_consumed)),
+    }
+
+    client = app.test_client()
+    print(f'{args.rows:,} rows')
+    for report, orm_fn in orm.items():
+        url = f'/reports/{report}'
+        assert client.get(url).status_code == 200
+        sql_ms = median_ms(lambda: client.get(url), args.repeat)
+        orm_ms = median_ms(orm_fn, args.repeat)
+        print(f'{report:<12} sql {sql_ms:9.1f} ms   orm hydration {orm_ms:9.1f} ms   ({orm_ms / sql_ms:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
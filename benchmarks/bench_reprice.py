@@ -0,0 +1,56 @@
+# benchmarks/bench_reprice.py
+"""Re-pricing history after a tariff change: batched pass vs. row by row.
+
+    python -m benchmarks.bench_reprice --rows 100000
+"""
+
+import argparse
+import time
+from datetime import date
+
+from benchmarks.common import LEDGER_START, seed_entries, use_temp_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--baseline-rows', type=int, default=5000,
+                        help='rows for the ORM row-by-row comparison')
+    args = parser.parse_args()
+
+    use_temp_database()
+    from app import app
+    from models import db, RentEntry, Tariff, TariffSlab, init_db
+    from tariffs import current_book, reprice
+
+    with app.app_context():
+        init_db()
+        seed_entries(db, RentEntry, 0, args.rows, args.rows)
+        # A slab tariff from the start of the ledger, so every row changes
+        db.session.add(Tariff(utility='electricity', effective_from=LEDGER_START, name='bench', slabs=[
+            TariffSlab(up_to=20, rate=4), TariffSlab(up_to=100, rate=10), TariffSlab(up_to=None, rate=15)]))
+        db.session.add(Tariff(utility='water', effective_from=date(2020, 1, 1), name='bench',
+                              slabs=[TariffSlab(up_to=None, rate=300)]))
+        db.session.commit()
+
+        scanned, updated, seconds = reprice()
+        print(f'batched     {scanned:>9,} rows  {updated:>9,} changed  {seconds:7.2f} s  '
+              f'{scanned / seconds:>10,.0f} rows/sec')
+
+        # Row by row through the ORM, as a per-entry recalculation would do it
+        book = current_book()
+        ids = [entry_id for (entry_id,) in db.session.query(RentEntry.id).limit(args.baseline_rows)]
+        started = time.perf_counter()
+        for entry_id in ids:
+            entry = db.session.get(RentEntry, entry_id)
+            entry.water, entry.electricity = book.charges(
+                entry.entry_date, entry.water_fill_count,
+                entry.electricity_previous_reading, entry.electricity_present_reading + 1)
+            db.session.commit()
+        seconds = time.perf_counter() - started
+        print(f'row by row  {args.baseline_rows:>9,} rows  {"":>17}  {seconds:7.2f} s  '
+              f'{args.baseline_rows / seconds:>10,.0f} rows/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/common.py
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks are run from the repository root as modules, e.g.
+
+    python -m benchmarks.bench_index_pagination
+
+Each one works on a throwaway SQLite file, never on rent.db.
+"""
+
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+TENANT_COUNT = 50
+LEDGER_START = date(2015, 1, 1)
+LEDGER_DAYS = 10 * 365
+
+
+def use_temp_database(prefix='rent-bench-'):
+    """Point app.py at a fresh SQLite file. Must be called before `import app`."""
+    path = os.path.join(tempfile.mkdtemp(prefix=prefix), 'rent.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    return path
+
+
+def synthetic_rows(start, stop, total):
+    """Yield RentEntry column dicts for rows start..stop-1 of a `total`-row ledger.
+
+    Entry dates are spread evenly over ten years so a month filter matches
+    roughly 1/120th of the table and a tenant filter 1/TENANT_COUNT of it.
+    """
+    for i in range(start, stop):
+        entry_date = LEDGER_START + timedelta(days=(i * LEDGER_DAYS) // total)
+        fills = i % 5
+        previous = float(i % 1000)
+        present = previous + (i % 120)
+        yield {
+            'tenant_name': f'Tenant {i % TENANT_COUNT:03d}',
+            'month': entry_date.strftime('%B %Y'),
+            'entry_date': entry_date,
+            'rent': 15000.0,
+            'water_fill_count': fills,
+            'water': fills * 250.0,
+            'waste': 200.0,
+            'electricity_previous_reading': previous,
+            'electricity_present_reading': present,
+            'electricity': (present - previous) * 13.0,
+            'repair': 0.0,
+            'misc': 0.0,
+        }
+
+
+def seed_entries(db, model, start, stop, total, batch_size=10_000):
+    """Bulk insert synthetic rows start..stop-1 in batched transactions."""
+    table = model.__table__
+    for batch_start in range(start, stop, batch_size):
+        batch_stop = min(batch_start + batch_size, stop)
+        db.session.execute(table.insert(), list(synthetic_rows(batch_start, batch_stop, total)))
+        db.session.commit()
+
+
+def ledger_rows(tenants, months, seed=0, start=LEDGER_START):
+    """Yield a realistic ledger: one entry per tenant per month, in date order.
+
+    Every tenant has a fixed rent, a meter that only ever counts up (with more
+    units used in the summer months), a few water tanker fills and the odd
+    repair or misc charge. Charges use the flat default rates. The same seed
+    always gives the same rows.
+    """
+    from tariffs import DEFAULT_RATES
+
+    rng = random.Random(seed)
+    profiles = [{
+        'name': f'Tenant {t:04d}',
+        'rent': float(rng.randrange(8000, 25001, 500)),
+        'usage': rng.uniform(40, 180),
+        'reading': float(rng.randrange(0, 5000)),
+    } for t in range(tenants)]
+
+    for m in range(months):
+        year, month = divmod(start.month - 1 + m, 12)
+        year, month = start.year + year, month + 1
+        for t, tenant in enumerate(profiles):
+            entry_date = date(year, month, 1 + t % 28)
+            summer = 1.5 if month in (5, 6, 7, 8) else 1.0
+            units = round(tenant['usage'] * summer * rng.uniform(0.7, 1.3))
+            previous, tenant['reading'] = tenant['reading'], tenant['reading'] + units
+            fills = rng.randint(0, 6)
+            yield {
+                'tenant_name': tenant['name'],
+                'month': entry_date.strftime('%B %Y'),
+                'entry_date': entry_date,
+                'rent': tenant['rent'],
+                'water_fill_count': fills,
+                'water': fills * DEFAULT_RATES['water'],
+                'waste': 200.0,
+                'electricity_previous_reading': previous,
+                'electricity_present_reading': tenant['reading'],
+                'electricity': units * DEFAULT_RATES['electricity'],
+                'repair': float(rng.choice((0, 0, 0, 0, 0, 0, 0, 0, 500, 2500))),
+                'misc': float(rng.choice((0, 0, 0, 0, 0, 0, 0, 0, 0, 300))),
+            }
+
+
+def seed_ledger(db, model, tenants, months, seed=0, batch_size=10_000):
+    """Bulk insert ledger_rows(tenants, months, seed) in batched transactions."""
+    table = model.__table__
+    rows = ledger_rows(tenants, months, seed)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+
+
+def median_ms(fn, repeat=20):
+    """Call fn() `repeat` times and return the median wall time in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
@@ -0,0 +1,160 @@
+# benchmarks/loadtest.py
+"""Mixed read/write load against real Gunicorn workers.
+
+    python -m benchmarks.loadtest --workers 1 2 4 --clients 16 --seconds 10
+    python -m benchmarks.loadtest --untuned     # SQLite defaults, no retries
+
+For each worker count a fresh, seeded database is served by
+`gunicorn -w N app:app`. Client threads then send a mix of ledger page loads,
+new entries (POST /) and deletes (POST /delete/<id>). The script reports
+throughput, p50/p99 latency and error rate.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from benchmarks.common import use_temp_database
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNTUNED_ENV = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_BUSY_TIMEOUT_MS': '0',
+    'DB_WRITE_RETRIES': '0',
+}
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def seed_database(rows):
+    """Create and seed a fresh database in a child process; returns (url, path)."""
+    path = use_temp_database('rent-load-')
+    url = os.environ['DATABASE_URL']
+    code = (
+        'from app import app; from models import db, RentEntry, init_db; '
+        'from benchmarks.common import seed_entries\n'
+        'with app.app_context():\n'
+        f'    init_db(); seed_entries(db, RentEntry, 0, {rows}, {rows})'
+    )
+    subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, check=True)
+    return url, path
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/?per_page=1', timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start')
+
+
+def client(base_url, stop, samples, deletable, read_ratio, write_ratio):
+    opener = urllib.request.build_opener(NoRedirect)
+    counter = itertools.count()
+    while not stop.is_set():
+        roll = random.random()
+        if roll < read_ratio:
+            request = urllib.request.Request(base_url + '/')
+        elif roll < read_ratio + write_ratio or not deletable:
+            form = urllib.parse.urlencode({
+                'tenant_name': f'Load Tenant {next(counter) % 20}', 'month': 'Load 2025',
+                'entry_date': '2025-01-15', 'rent': '12000', 'water_fill_count': '2',
+                'electricity_previous_reading': '100', 'electricity_present_reading': '150',
+            }).encode()
+            request = urllib.request.Request(base_url + '/', data=form)
+        else:
+            request = urllib.request.Request(f'{base_url}/delete/{deletable.pop()}', data=b'')
+
+        started = time.perf_counter()
+        try:
+            response = opener.open(request, timeout=30)
+            status = response.status
+            response.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0
+        samples.append((time.perf_counter() - started, status))
+
+
+def run(workers, args):
+    db_url, db_path = seed_database(args.rows)
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=db_url, PDF_CACHE_DIR=os.path.join(os.path.dirname(db_path), 'pdf'))
+    if args.untuned:
+        env.update(UNTUNED_ENV)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'app:app'],
+        cwd=REPO_ROOT, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(base_url)
+        stop = threading.Event()
+        # Deletes remove seeded rows in random order, each one once
+        samples, deletable = [], list(range(1, args.rows + 1))
+        random.shuffle(deletable)
+        threads = [threading.Thread(target=client, args=(base_url, stop, samples, deletable,
+                                                         args.read_ratio, args.write_ratio))
+                   for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    errors = sum(1 for _, status in samples if status not in (200, 302, 404))
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f'workers={workers:<3} requests={len(samples):<7} rps={len(samples) / args.seconds:8.1f}  '
+          f'p50={statistics.median(latencies):7.1f} ms  p99={p99:7.1f} ms  '
+          f'errors={errors / len(samples):.2%}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--read-ratio', type=float, default=0.6)
+    parser.add_argument('--write-ratio', type=float, default=0.3,
+                        help='share of POST /; the rest are deletes')
+    parser.add_argument('--untuned', action='store_true',
+                        help='run with SQLite defaults and no write retries')
+    args = parser.parse_args()
+
+    print('SQLite defaults, no retries' if args.untuned else 'WAL + busy_timeout + retries')
+    for workers in args.workers:
+        run(workers, args)
+
+
+if __name__ == '__main__':
+    main()
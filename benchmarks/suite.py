@@ -0,0 +1,293 @@
+# benchmarks/suite.py
+"""Benchmark suite for the ledger routes, with regression checks.
+
+    python -m benchmarks.suite                                # 200 tenants x 60 months
+    python -m benchmarks.suite --tenants 1000 --months 120 --output big.json
+    python -m benchmarks.suite --load-processes 4 --load-seconds 10
+    python -m benchmarks.suite --baseline baseline.json       # exit 1 on a regression
+
+A fresh database is seeded with ledger_rows() (same seed, same rows). Every
+scenario then goes through the Flask test client: index GET (first page,
+deep page, tenant and month filters), index POST, delete_entry and
+generate_pdf (cold render, cache hit and 304). Each scenario records
+p50/p95 latency and the peak Python memory it allocates (tracemalloc).
+
+--load-processes N also starts N processes, each with its own test client,
+that send a mix of reads, writes, deletes and invoice downloads to the same
+SQLite file at the same time.
+
+The results are written as JSON (--output). Keep a run from main as the
+baseline and pass it as --baseline. The run fails if any p50 latency or peak
+memory grows past --max-slowdown / --max-memory-growth. Differences smaller
+than --noise-ms are ignored.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.common import seed_ledger, use_temp_database
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NEW_ENTRY = {
+    'tenant_name': 'Bench Tenant', 'month': 'January 2030', 'entry_date': '2030-01-15',
+    'rent': '12000', 'water_fill_count': '2', 'waste': '200',
+    'electricity_previous_reading': '1000', 'electricity_present_reading': '1120',
+}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def scenarios(client, ids, deep_cursor, tenant, month):
+    """Return {name: (call, expected status)}; each call makes one request.
+
+    `ids` are the seeded entry ids in date order. Scenarios that use up an
+    entry (delete, cold render) take ids from their own half of the list.
+    """
+    deletable = list(reversed(ids[len(ids) // 2:]))
+    uncached = list(ids[:len(ids) // 2])
+    cached_id = ids[len(ids) // 4]
+    etag = client.get(f'/generate_pdf/{cached_id}').headers['ETag']
+
+    return {
+        'index_first_page': (lambda: client.get('/'), 200),
+        'index_deep_page': (lambda: client.get(f'/?before={deep_cursor}'), 200),
+        'index_tenant_filter': (lambda: client.get('/', query_string={'tenant': tenant}), 200),
+        'index_month_filter': (lambda: client.get('/', query_string={'month': month}), 200),
+        'index_post': (lambda: client.post('/', data=NEW_ENTRY), 302),
+        'delete_entry': (lambda: client.post(f'/delete/{deletable.pop()}'), 302),
+        'generate_pdf_cold': (lambda: client.get(f'/generate_pdf/{uncached.pop()}'), 200),
+        'generate_pdf_cached': (lambda: client.get(f'/generate_pdf/{cached_id}'), 200),
+        'generate_pdf_not_modified': (
+            lambda: client.get(f'/generate_pdf/{cached_id}', headers={'If-None-Match': etag}), 304),
+    }
+
+
+def measure(call, expected, repeat, memory_repeat, warmup=2):
+    def checked():
+        status = call().status_code
+        if status != expected:
+            raise RuntimeError(f'expected HTTP {expected}, got {status}')
+
+    for _ in range(warmup):
+        checked()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        checked()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    # Measured separately: tracemalloc slows every allocation down
+    tracemalloc.start()
+    for _ in range(memory_repeat):
+        checked()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def load_worker(index, seconds, tenants, ids, deletable, barrier, results):
+    """One load process: a random mix of requests for `seconds`, after the barrier."""
+    from app import app
+
+    client = app.test_client()
+    rng = random.Random(index)
+    client.get('/')
+    barrier.wait()
+
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        started = time.perf_counter()
+        if roll < 0.6:
+            response = client.get('/' if roll < 0.4 else f'/?tenant=Tenant%20{rng.randrange(tenants):04d}')
+        elif roll < 0.8:
+            response = client.post('/', data=NEW_ENTRY)
+        elif roll < 0.9 and deletable:
+            response = client.post(f'/delete/{deletable.pop()}')
+        else:
+            response = client.get(f'/generate_pdf/{rng.choice(ids)}')
+        samples.append(((time.perf_counter() - started) * 1000, response.status_code < 400))
+    results.put(samples)
+
+
+def run_load(processes, seconds, tenants, ids):
+    """Run `processes` load workers against the database at once; returns a summary."""
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(processes)
+    results = ctx.Queue()
+    # Each worker deletes its own slice of entries; invoices come from the rest
+    readable, deletable = ids[:len(ids) // 2], ids[len(ids) // 2:]
+    workers = [ctx.Process(target=load_worker,
+                           args=(i, seconds, tenants, readable, deletable[i::processes], barrier, results))
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    samples = [sample for _ in workers for sample in results.get()]
+    for worker in workers:
+        worker.join()
+        if worker.exitcode:
+            raise RuntimeError(f'load worker exited with code {worker.exitcode}')
+
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        'processes': processes,
+        'seconds': seconds,
+        'requests': len(samples),
+        'rps': round(len(samples) / seconds, 1),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'error_rate': round(sum(1 for _, ok in samples if not ok) / len(samples), 4),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    db_path = use_temp_database('rent-suite-')
+    os.environ['PDF_CACHE_DIR'] = os.path.join(os.path.dirname(db_path), 'pdf_cache')
+    os.environ['PDF_RENDER_ASYNC'] = '0'
+    from app import app, db, RentEntry
+    from meters import backfill
+    from models import init_db
+
+    with app.app_context():
+        init_db()
+        started = time.perf_counter()
+        seed_ledger(db, RentEntry, args.tenants, args.months, args.seed)
+        backfill()
+        seed_seconds = time.perf_counter() - started
+        ids = [row.id for row in db.session.query(RentEntry.id)
+               .order_by(RentEntry.entry_date, RentEntry.id)]
+        # A cursor ~10% of the way into the ledger, i.e. a very deep page
+        deep_cursor = db.session.get(RentEntry, ids[len(ids) // 10]).cursor
+        middle = db.session.get(RentEntry, ids[len(ids) // 2])
+        tenant, month = middle.tenant_name, middle.month
+
+    needed = 2 + args.repeat + args.memory_repeat
+    if len(ids) < 8 * needed:
+        sys.exit(f'{len(ids)} rows is too few for --repeat {args.repeat}; seed more tenants or months')
+
+    client = app.test_client()
+    results = {}
+    for name, (call, expected) in scenarios(client, ids, deep_cursor, tenant, month).items():
+        results[name] = measure(call, expected, args.repeat, args.memory_repeat)
+        print(f'{name:<28} p50 {results[name]["p50_ms"]:8.2f} ms  '
+              f'p95 {results[name]["p95_ms"]:8.2f} ms  peak {results[name]["peak_kib"]:9.1f} KiB')
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'dataset': {'tenants': args.tenants, 'months': args.months, 'seed': args.seed,
+                    'rows': len(ids), 'seed_seconds': round(seed_seconds, 2)},
+        'scenarios': results,
+        # ru_maxrss is in KiB on Linux
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    if args.load_processes:
+        # Entries the scenarios have not used up
+        with app.app_context():
+            remaining = [row.id for row in db.session.query(RentEntry.id).order_by(RentEntry.id)]
+        report['load'] = run_load(args.load_processes, args.load_seconds, args.tenants, remaining)
+        load = report['load']
+        print(f'load x{load["processes"]:<3} requests={load["requests"]:<7} rps={load["rps"]:8.1f}  '
+              f'p50={load["p50_ms"]:7.1f} ms  p99={load["p99_ms"]:7.1f} ms  '
+              f'errors={load["error_rate"]:.2%}')
+    return report
+
+
+def regressions(report, baseline, max_slowdown, max_memory_growth, noise_ms):
+    """Return a list of human-readable regressions of `report` against `baseline`."""
+    problems = []
+
+    def check(label, new, old, limit, floor):
+        if old is not None and new > old * limit and new - old > floor:
+            problems.append(f'{label}: {old} -> {new} (limit x{limit})')
+
+    for name, new in report['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old:
+            check(f'{name} p50_ms', new['p50_ms'], old['p50_ms'], max_slowdown, noise_ms)
+            check(f'{name} peak_kib', new['peak_kib'], old['peak_kib'], max_memory_growth, 64)
+    check('max_rss_kib', report['max_rss_kib'], baseline.get('max_rss_kib'), max_memory_growth, 1024)
+
+    load, old_load = report.get('load'), baseline.get('load')
+    if load and old_load and load['processes'] == old_load['processes']:
+        check('load p50_ms', load['p50_ms'], old_load['p50_ms'], max_slowdown, noise_ms)
+        check('load p99_ms', load['p99_ms'], old_load['p99_ms'], max_slowdown, noise_ms)
+        if load['error_rate'] > old_load['error_rate'] + 0.01:
+            problems.append(f'load error_rate: {old_load["error_rate"]} -> {load["error_rate"]}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', type=int, default=200)
+    parser.add_argument('--months', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=30, help='timed requests per scenario')
+    parser.add_argument('--memory-repeat', type=int, default=5,
+                        help='requests per scenario measured with tracemalloc')
+    parser.add_argument('--load-processes', type=int, default=0)
+    parser.add_argument('--load-seconds', type=float, default=10)
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', help='results JSON from an earlier run to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=1.25)
+    parser.add_argument('--max-memory-growth', type=float, default=1.25)
+    parser.add_argument('--noise-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        dataset = ('tenants', 'months', 'seed')
+        if any(baseline['dataset'][key] != report['dataset'][key] for key in dataset):
+            sys.exit(f'{args.baseline} was recorded on a different dataset: {baseline["dataset"]}')
+        problems = regressions(report, baseline, args.max_slowdown, args.max_memory_growth, args.noise_ms)
+        for problem in problems:
+            print('REGRESSION', problem)
+        if problems:
+            sys.exit(1)
+        print(f'No regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# database.py
+"""SQLite connection tuning and a retrying write path.
+
+Several Gunicorn workers share one rent.db file. With SQLite's defaults
+(rollback journal, no busy timeout) a writer locks out every reader and any
+overlapping write fails at once with "database is locked". Every connection
+therefore gets:
+
+* journal_mode=WAL: readers never block the writer and vice versa
+* synchronous=NORMAL: fsync at checkpoints rather than every commit, which
+  is durable in WAL mode except against power loss
+* busy_timeout: wait for a competing writer instead of failing immediately
+* mmap_size: serve reads from the page cache without read() copies
+
+Each setting can be overridden from the environment; see init_database().
+"""
+
+import os
+import random
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def is_memory_database(uri):
+    """True for an in-memory SQLite URL: sqlite://, sqlite:///:memory: or mode=memory."""
+    url = make_url(uri)
+    return (url.get_backend_name() == 'sqlite'
+            and (url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'))
+
+
+def init_database(app):
+    """Fill in database settings not already configured, then bind `db` to the app."""
+    app.config.setdefault('SQLITE_PRAGMAS', {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'foreign_keys': 'ON',
+    })
+    # Pool per worker process: Gunicorn sync workers use one connection at a
+    # time, threaded servers and the render/job threads may use a few more.
+    # An in-memory database gets Flask-SQLAlchemy's single-connection
+    # StaticPool instead, which takes none of these options.
+    if not is_memory_database(app.config['SQLALCHEMY_DATABASE_URI']):
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+            'pool_size': _env_int('DB_POOL_SIZE', 5),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': 30,
+        })
+    app.config.setdefault('DB_WRITE_RETRIES', _env_int('DB_WRITE_RETRIES', 5))
+
+    db.init_app(app)
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        pragmas = app.config['SQLITE_PRAGMAS']
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+            cursor.close()
+
+
+def is_busy_error(error):
+    """True for SQLite's "database is locked" / "database is busy" errors."""
+    message = str(getattr(error, 'orig', error)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def run_write(work, *args, retries=None, **kwargs):
+    """Call work(*args, **kwargs) and commit, retrying if SQLite reports busy.
+
+    busy_timeout already makes most writers wait their turn, but SQLite
+    refuses to wait when a read transaction tries to upgrade to a write
+    while another writer holds the lock. The whole unit of work is rolled
+    back and repeated with jittered exponential backoff, so `work` must be
+    safe to call again. Returns whatever `work` returns.
+    """
+    if retries is None:
+        retries = current_app.config['DB_WRITE_RETRIES']
+    for attempt in range(retries + 1):
+        try:
+            result = work(*args, **kwargs)
+            db.session.commit()
+            return result
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt == retries or not is_busy_error(e):
+                raise
+            time.sleep(0.02 * (2 ** attempt) * (0.5 + random.random()))
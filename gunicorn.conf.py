@@ -0,0 +1,30 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn app:app` when run from this directory.
+
+import os
+
+# Import app.py once in the master so forked workers share its memory,
+# including the invoice fonts and logo loaded in when_ready() below.
+preload_app = True
+
+
+def when_ready(server):
+    from invoice import warm_up
+    warm_up()
+
+
+def post_fork(server, worker):
+    # Never share pooled SQLite connections with the master or other workers
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    # Each worker starts its own bulk render pool; with one process per CPU
+    # in every pool, -w 4 on 8 cores would run 32 renders against 8 CPUs
+    if 'PDF_RENDER_WORKERS' not in os.environ:
+        app.config['PDF_RENDER_WORKERS'] = max(1, (os.cpu_count() or 1) // server.cfg.workers)
+
+    # A no-op when the master already warmed up; covers preload_app = False.
+    from invoice import warm_up
+    warm_up()
@@ -0,0 +1,304 @@
+# invoice.py
+"""ReportLab invoice rendering, kept free of Flask and the database.
+
+Everything here works on plain InvoiceData tuples so invoices can be drawn in
+worker processes as well as inside a request.
+"""
+
+import copy
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from weakref import WeakKeyDictionary
+
+from reportlab import rl_config
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.utils import ImageReader
+
+logger = logging.getLogger(__name__)
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Bump whenever the invoice layout or wording changes, so cached PDFs
+# rendered from the old template are no longer served (see pdf_cache.py).
+TEMPLATE_VERSION = '1'
+
+InvoiceData = namedtuple('InvoiceData', [
+    'id', 'tenant_name', 'month', 'entry_date', 'rent',
+    'water_fill_count', 'water', 'waste',
+    'electricity_previous_reading', 'electricity_present_reading', 'electricity',
+    'repair', 'misc', 'total',
+    'water_rate', 'electricity_rate',
+])
+
+
+def invoice_data(entry, water_rate, electricity_rate):
+    """Snapshot a RentEntry into a picklable InvoiceData.
+
+    The rates are display strings such as 'NRS 13.00/unit', describing the
+    tariffs the entry was priced with.
+    """
+    fields = {field: getattr(entry, field) for field in InvoiceData._fields[:-2]}
+    return InvoiceData(**fields, water_rate=water_rate, electricity_rate=electricity_rate)
+
+
+def invoice_filename(entry):
+    return f'invoice_{entry.tenant_name}_{entry.entry_date}.pdf'
+
+
+# --- Rendering resources ---
+# Parsed once per process and reused by every invoice. In a forked Gunicorn
+# worker they are inherited from the master (see gunicorn.conf.py), so the
+# worker never pays for them at all.
+FONT_PATH = os.path.join(basedir, 'DejaVuSans.ttf')
+# The repo's directory is 'Static' (capital S), which matters on case-sensitive filesystems
+LOGO_PATH = os.path.join(basedir, 'Static', 'logo.jpeg')
+
+# Embed images as binary streams. ReportLab's default ASCII85-encodes the
+# logo in pure Python for every document, which cost more than all the text
+# drawing on an invoice.
+rl_config.useA85 = 0
+
+_main_font = None
+_logo = None
+_logo_lock = threading.Lock()
+
+def register_fonts():
+    """Register DejaVu with ReportLab (once) and return the font family to draw with."""
+    global _main_font
+    if _main_font is not None:
+        return _main_font
+
+    main_font = 'Helvetica'
+    if os.path.exists(FONT_PATH):
+        try:
+            # Parse the TTF once; the style variants share the parsed face and
+            # only get their own per-document subset state.
+            regular = TTFont('DejaVu', FONT_PATH)
+            pdfmetrics.registerFont(regular)
+            for style in ('Bold', 'Italic', 'BoldItalic'):
+                variant = copy.copy(regular)
+                variant.fontName = f'DejaVu-{style}'
+                variant.state = WeakKeyDictionary()
+                pdfmetrics.registerFont(variant)
+            main_font = 'DejaVu'
+        except Exception as e:
+            logger.error(f"ReportLab: Error registering DejaVuSans.ttf: {e}. Falling back to Helvetica.")
+    else:
+        logger.error("ReportLab: DejaVuSans.ttf not found. Using Helvetica.")
+
+    _main_font = main_font
+    return _main_font
+
+def load_logo():
+    """Return the logo as a cached ImageReader, or None if there is no logo file."""
+    global _logo
+    if _logo is None and os.path.exists(LOGO_PATH):
+        # Read into memory so forked workers never share a file offset
+        with open(LOGO_PATH, 'rb') as f:
+            _logo = ImageReader(io.BytesIO(f.read()))
+    return _logo
+
+def warm_up():
+    """Load every rendering resource now rather than on the first invoice.
+
+    Renders a throwaway invoice: ReportLab only decodes the logo JPEG and
+    fills its own caches on the first drawImage()/drawString(), so loading
+    the files is not enough to make the first real invoice full speed.
+    """
+    register_fonts()
+    load_logo()
+    render_invoice(InvoiceData(
+        id=0, tenant_name='Warm-up', month='', entry_date=date(2000, 1, 1), rent=0.0,
+        water_fill_count=0, water=0.0, waste=0.0,
+        electricity_previous_reading=0.0, electricity_present_reading=0.0, electricity=0.0,
+        repair=0.0, misc=0.0, total=0.0, water_rate='', electricity_rate=''))
+
+
+# --- Drawing ---
+def draw_invoice(p, entry, main_font):
+    """Draw one invoice onto the current page of canvas `p`."""
+    width, height = letter
+
+    # --- PDF Content Drawing ---
+    
+    logo = load_logo()
+    logo_height_points = 0.8 * inch # Define desired height for the logo (0.8 inches)
+    logo_width_points = 0.8 * inch # Define desired width for the logo (0.8 inches)
+
+    # --- NEW: DRAW THE LOGO WITH CORRECTED POSITIONING ---
+    if logo is not None:
+        # Calculate Y position: height - top_margin - logo_height
+        # This places the TOP of the logo at (height - top_margin)
+        top_margin = 0.75 * inch 
+        logo_y_position = height - top_margin - logo_height_points
+        
+        # Calculate X position to center it (optional, you can keep it left if preferred)
+        # For left alignment, use x=1*inch
+        logo_x_position = (width - logo_width_points) / 2.0 # Center horizontally
+
+        # The reader's in-memory file is shared, so serialise access to it
+        with _logo_lock:
+            p.drawImage(logo, 
+                        x=logo_x_position, # Centered X position
+                        y=logo_y_position, # Corrected Y position for the top alignment
+                        width=logo_width_points, 
+                        height=logo_height_points, # Specify height explicitly for better control
+                        preserveAspectRatio=True, 
+                        mask='auto')
+        
+        # Adjust vertical spacing after the logo
+        y_offset_after_logo = top_margin + logo_height_points + 0.2*inch # Space after logo
+    else:
+        y_offset_after_logo = 1.0 * inch # Default top margin if no logo
+
+    # Invoice Title (adjusted to be below the logo)
+    p.setFont(f"{main_font}-Bold", 16)
+    p.drawCentredString(width / 2.0, height - y_offset_after_logo, "Aryal Homes - Rent Invoice")
+
+    # Start main content further down to avoid overlapping with logo/title
+    start_content_y = height - y_offset_after_logo - 0.5*inch # Adjust this value as needed
+
+    p.setFont(main_font, 11)
+    p.drawString(1*inch, start_content_y, f"Tenant Name: {entry.tenant_name}")
+    p.drawString(1*inch, start_content_y- 0.2*inch, f"Month-Year: {entry.month}")
+    p.drawString(1*inch, start_content_y - 0.4*inch, f"Invoice Date: {entry.entry_date.strftime('%B %d, %Y')}")   
+   
+    # --- The rest of the function (adjust y_position start) ---
+    y_position = start_content_y - 0.7*inch # Adjusted start position for table
+
+    table_left_margin = 1*inch
+    table_right_margin = width - 1*inch
+    
+    p.setFont(f"{main_font}-Bold", 12)
+    p.drawString(table_left_margin, y_position, "Category")
+    p.drawRightString(table_right_margin, y_position, "Amount (NRS)")
+    y_position -= 0.2*inch
+    p.line(table_left_margin, y_position, table_right_margin, y_position)
+    y_position -= 0.25*inch
+    
+    p.setFont(main_font, 11)
+    charges = [("Rent", entry.rent)]
+    for category, amount in charges:
+        p.drawString(table_left_margin, y_position, category)
+        p.drawRightString(table_right_margin, y_position, f"{amount:,.2f}")
+        y_position -= 0.25*inch
+    
+    p.setFont(f"{main_font}-Bold", 11)
+    p.drawString(table_left_margin, y_position, "Water Details")
+    y_position -= 0.25*inch
+    p.setFont(main_font, 10)
+    p.drawString(table_left_margin + 0.2*inch, y_position, f"Times Filled: {entry.water_fill_count} @ {entry.water_rate}")
+    y_position -= 0.25*inch
+    p.setFont(main_font, 11)
+    p.drawString(table_left_margin, y_position, "Water Cost")
+    p.drawRightString(table_right_margin, y_position, f"{entry.water:,.2f}")
+    y_position -= 0.25*inch
+
+    units_consumed = entry.electricity_present_reading - entry.electricity_previous_reading
+    p.setFont(f"{main_font}-Bold", 11)
+    p.drawString(table_left_margin, y_position, "Electricity Details")
+    y_position -= 0.25*inch
+    p.setFont(main_font, 10)
+    p.drawString(table_left_margin + 0.2*inch, y_position, f"Present Reading: {entry.electricity_present_reading:,.2f}")
+    y_position -= 0.20*inch
+    p.drawString(table_left_margin + 0.2*inch, y_position, f"Previous Reading: {entry.electricity_previous_reading:,.2f}")
+    y_position -= 0.20*inch
+    p.drawString(table_left_margin + 0.2*inch, y_position, f"Units Consumed: {units_consumed:,.2f} units @ {entry.electricity_rate}")
+    y_position -= 0.25*inch
+    p.setFont(main_font, 11)
+    p.drawString(table_left_margin, y_position, "Electricity Cost")
+    p.drawRightString(table_right_margin, y_position, f"{entry.electricity:,.2f}")
+    y_position -= 0.25*inch
+
+    other_charges = [
+        ("Waste Management", entry.waste),
+        ("Repair Costs", entry.repair),
+        ("Miscellaneous", entry.misc),
+    ]
+    for category, amount in other_charges:
+        p.drawString(table_left_margin, y_position, category)
+        p.drawRightString(table_right_margin, y_position, f"{amount:,.2f}")
+        y_position -= 0.25*inch
+    
+    y_position -= 0.2*inch
+    p.line(table_left_margin, y_position, table_right_margin, y_position)
+    y_position -= 0.25*inch
+    p.setFont(f"{main_font}-Bold", 12)
+    p.drawString(table_left_margin, y_position, "Total Amount Due")
+    p.drawRightString(table_right_margin, y_position, f"{entry.total:,.2f}")
+
+
+def render_invoice(entry):
+    """Render a single invoice and return the PDF bytes."""
+    return render_invoices([entry])
+
+
+def render_invoices(entries):
+    """Render several invoices as consecutive pages of one PDF document."""
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    main_font = register_fonts()
+    for entry in entries:
+        draw_invoice(p, entry, main_font)
+        p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+# --- Bulk rendering ---
+_pool = None
+_pool_pid = None
+
+def render_pool(max_workers=None):
+    """Return this process's invoice render pool, creating it on first use.
+
+    Canvas drawing is pure-Python CPU work that holds the GIL, so bulk jobs are
+    spread over processes. The pool is tied to the PID that created it, so a
+    forked Gunicorn worker builds its own rather than inheriting a dead one.
+    Workers are spawned, not forked, to stay safe under threaded servers.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1,
+                                    mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=warm_up)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def timed_render_invoice(entry):
+    """render_invoice() that also returns how long it took, for pool workers."""
+    started = time.perf_counter()
+    pdf = render_invoice(entry)
+    return pdf, time.perf_counter() - started
+
+
+def render_stream(entries, pool, window):
+    """Yield (entry, pdf_bytes, render_seconds) in order, rendering ahead on `pool`.
+
+    At most `window` renders are in flight or finished-but-unconsumed at any
+    time, so memory stays bounded by the window rather than the batch size.
+    """
+    pending = deque()
+    entries = iter(entries)
+    for entry in entries:
+        pending.append((entry, pool.submit(timed_render_invoice, entry)))
+        if len(pending) >= window:
+            break
+    while pending:
+        entry, future = pending.popleft()
+        for next_entry in entries:
+            pending.append((next_entry, pool.submit(timed_render_invoice, next_entry)))
+            break
+        yield (entry, *future.result())
+
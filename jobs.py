@@ -0,0 +1,342 @@
+# jobs.py
+"""Background invoice rendering on a persistent, SQLite-backed queue.
+
+Web requests only enqueue RenderJob rows. A separate pool of worker
+processes (`flask jobs worker --processes N`) claims jobs one at a time,
+renders them and stores the PDF in the shared on-disk invoice cache, where
+the download endpoint picks it up. The queue lives in the application
+database, so queued jobs survive restarts of both the web and the worker
+processes.
+
+Backpressure: once RENDER_QUEUE_MAX_QUEUED jobs are waiting, new work is
+refused with 503 and a Retry-After header instead of growing the backlog.
+The number of worker processes caps how many renders run at once.
+"""
+
+import io
+import multiprocessing
+import os
+import signal
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import Blueprint, Response, abort, current_app, jsonify, request, send_file, url_for
+from sqlalchemy import update
+
+from database import run_write
+from invoice import invoice_filename, render_invoice
+from metrics import Gauge, flush_if_due, registry, timed_render
+from models import db, RentEntry, RenderJob
+from pdf_cache import cache_key
+from tariffs import current_book, entry_invoice
+
+jobs = Blueprint('jobs', __name__)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+class QueueFull(Exception):
+    """Raised when accepting more jobs would exceed RENDER_QUEUE_MAX_QUEUED."""
+
+
+def _cache():
+    return current_app.extensions['pdf_cache']
+
+
+# --- Queue operations ---
+def enqueue(entries):
+    """Queue renders for RentEntry objects; returns one RenderJob per entry.
+
+    An entry whose current invoice is already cached gets a job that is done
+    straight away, and an entry already queued or running with the same
+    content reuses that job, so repeated clicks never pile up duplicate work.
+    """
+    book = current_book()
+    wanted = [(entry, cache_key(entry_invoice(entry, book))) for entry in entries]
+
+    existing = {}
+    if wanted:
+        pending = RenderJob.query.filter(
+            RenderJob.entry_id.in_([entry.id for entry, _ in wanted]),
+            RenderJob.status.in_(('queued', 'running')))
+        existing = {(job.entry_id, job.cache_key): job for job in pending}
+
+    result, new_jobs = [], []
+    for entry, key in wanted:
+        job = existing.get((entry.id, key))
+        if job is None:
+            cached = _cache().contains(entry.id, key)
+            job = RenderJob(entry_id=entry.id, cache_key=key,
+                            status='done' if cached else 'queued',
+                            finished_at=datetime.utcnow() if cached else None)
+            new_jobs.append(job)
+            existing[(entry.id, key)] = job
+        result.append(job)
+
+    queued = sum(1 for job in new_jobs if job.status == 'queued')
+    if queued and queue_depth() + queued > current_app.config['RENDER_QUEUE_MAX_QUEUED']:
+        raise QueueFull()
+    if new_jobs:
+        run_write(db.session.add_all, new_jobs)
+    return result
+
+
+def queue_depth():
+    return RenderJob.query.filter_by(status='queued').count()
+
+
+def collect_job_counts():
+    counts = dict(db.session.query(RenderJob.status, db.func.count(RenderJob.id))
+                  .group_by(RenderJob.status).all())
+    for status in JOB_STATUSES:
+        render_jobs.set(status, value=counts.get(status, 0))
+
+
+render_jobs = registry.add_shared(
+    Gauge('render_jobs', 'Render jobs in the queue table, by status.', ('status',)), collect_job_counts)
+
+
+def claim_next(worker):
+    """Atomically move the oldest queued job to 'running'; returns its id or None.
+
+    A single UPDATE ... RETURNING, so two workers can never claim the same job.
+    """
+    oldest = (db.select(RenderJob.id).where(RenderJob.status == 'queued')
+              .order_by(RenderJob.id).limit(1).scalar_subquery())
+    claim = (update(RenderJob).where(RenderJob.id == oldest, RenderJob.status == 'queued')
+             .values(status='running', worker=worker, started_at=datetime.utcnow(),
+                     attempts=RenderJob.attempts + 1)
+             .returning(RenderJob.id))
+    return run_write(lambda: db.session.execute(claim).scalar())
+
+
+def _set_status(job_id, status, **fields):
+    db.session.execute(update(RenderJob).where(RenderJob.id == job_id).values(status=status, **fields))
+
+
+def process(job_id):
+    """Render one claimed job into the invoice cache and mark it done or failed."""
+    job = db.session.get(RenderJob, job_id)
+    entry = db.session.get(RentEntry, job.entry_id)
+    try:
+        if entry is None:
+            raise LookupError(f'entry {job.entry_id} no longer exists')
+        data = entry_invoice(entry)
+        # Render what the entry says now, even if it was edited after queueing
+        key = cache_key(data)
+        if not _cache().contains(entry.id, key):
+            _cache().put(entry.id, key, timed_render('background', render_invoice, data))
+    except Exception as e:
+        current_app.logger.exception('Render job %s failed', job_id)
+        run_write(_set_status, job_id, 'failed', error=str(e), finished_at=datetime.utcnow())
+    else:
+        run_write(_set_status, job_id, 'done', cache_key=key, error=None, finished_at=datetime.utcnow())
+
+
+def recover_and_purge():
+    """Requeue jobs whose worker died mid-render, and drop old finished jobs."""
+    config = current_app.config
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=config['RENDER_JOB_TIMEOUT'])
+    running = RenderJob.status == 'running'
+    started_long_ago = RenderJob.started_at < stale
+
+    def housekeeping():
+        db.session.execute(update(RenderJob)
+                           .where(running, started_long_ago,
+                                  RenderJob.attempts < config['RENDER_JOB_MAX_ATTEMPTS'])
+                           .values(status='queued'))
+        db.session.execute(update(RenderJob)
+                           .where(running, started_long_ago)
+                           .values(status='failed', error='worker timed out', finished_at=now))
+        db.session.execute(db.delete(RenderJob).where(
+            RenderJob.status.in_(('done', 'failed')),
+            RenderJob.finished_at < now - timedelta(days=config['RENDER_JOB_RETENTION_DAYS'])))
+
+    run_write(housekeeping)
+
+
+# --- Worker processes ---
+def worker_loop(poll_interval=0.5, max_backoff=30):
+    """Claim and render jobs until SIGTERM/SIGINT. Runs in a worker process.
+
+    An error outside a job's own render (the database staying locked past
+    run_write's retries, say) is logged and the loop backs off and carries
+    on: worker_command never replaces a worker that exits. A job left
+    'running' by such an error is requeued by recover_and_purge().
+    """
+    from app import app
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+    name = f'{os.uname().nodename}:{os.getpid()}'
+
+    def sleep(seconds):
+        # In short steps, so a stop signal is not held up by a long backoff
+        deadline = time.monotonic() + seconds
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(min(poll_interval, deadline - time.monotonic()))
+
+    with app.app_context():
+        from invoice import warm_up
+        warm_up()
+        idle_since = None
+        failures = 0
+        while not stopping:
+            try:
+                job_id = claim_next(name)
+                if job_id is not None:
+                    process(job_id)
+                    db.session.remove()
+                    flush_if_due(app)
+                    idle_since = None
+                    failures = 0
+                    continue
+                # Housekeeping only while idle, so it never delays queued work
+                if idle_since is None:
+                    recover_and_purge()
+                    idle_since = time.monotonic()
+                failures = 0
+            except Exception:
+                failures = min(failures + 1, 10)
+                backoff = min(poll_interval * 2 ** failures, max_backoff)
+                app.logger.exception('Render worker %s failed; retrying in %.1fs', name, backoff)
+                db.session.rollback()
+                db.session.remove()
+                sleep(backoff)
+                continue
+            sleep(poll_interval)
+
+
+@jobs.cli.command('worker')
+@click.option('--processes', type=int, default=lambda: os.cpu_count() or 1, show_default='CPU count',
+              help='Renders allowed to run at once.')
+def worker_command(processes):
+    """Run background invoice render workers."""
+    # systemd and supervisord stop services with SIGTERM, which would otherwise
+    # kill this process without stopping the workers; treat it like Ctrl+C
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=worker_loop, daemon=True) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    print(f'Started {processes} render worker(s). Ctrl+C to stop.')
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Each worker finishes its current job and exits
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+@jobs.cli.command('close-month')
+@click.argument('month')
+def close_month_command(month):
+    """Queue every invoice of MONTH for pre-rendering."""
+    entries = RentEntry.query.filter_by(month=month).all()
+    try:
+        queued = enqueue(entries)
+    except QueueFull:
+        raise click.ClickException('The render queue is full; try again once it drains.')
+    print(f"Queued {sum(1 for job in queued if job.status == 'queued')} of {len(entries)} invoices for {month}.")
+
+
+# --- Routes ---
+def _job_json(job):
+    data = {
+        'id': job.id,
+        'entry_id': job.entry_id,
+        'status': job.status,
+        'attempts': job.attempts,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': url_for('jobs.job_status', job_id=job.id),
+        'download_url': url_for('jobs.download', job_id=job.id),
+    }
+    if job.status == 'queued':
+        data['queue_position'] = RenderJob.query.filter(
+            RenderJob.status == 'queued', RenderJob.id <= job.id).count()
+    return data
+
+
+def queue_full_response():
+    response = jsonify({'error': 'render queue is full'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+@jobs.route('/jobs/render/<int:entry_id>', methods=['POST'])
+def render_entry(entry_id):
+    """Queue one invoice; 202 with the job's status and download URLs."""
+    entry = RentEntry.query.get_or_404(entry_id)
+    try:
+        job, = enqueue([entry])
+    except QueueFull:
+        return queue_full_response()
+    return jsonify(_job_json(job)), 202, {'Location': url_for('jobs.job_status', job_id=job.id)}
+
+
+@jobs.route('/months/close', methods=['POST'])
+def close_month():
+    """Pre-render every invoice of a month (`month` in the form or JSON body)."""
+    values = request.get_json(silent=True) or request.values
+    month = (values.get('month') or '').strip()
+    if not month:
+        abort(400, description='month is required')
+    entries = RentEntry.query.filter_by(month=month).all()
+    if not entries:
+        abort(404, description=f'No entries for {month}')
+    try:
+        queued = enqueue(entries)
+    except QueueFull:
+        return queue_full_response()
+    return jsonify({
+        'month': month,
+        'entries': len(entries),
+        'queued': sum(1 for job in queued if job.status == 'queued'),
+        'jobs': [job.id for job in queued],
+    }), 202
+
+
+@jobs.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    return jsonify(_job_json(RenderJob.query.get_or_404(job_id)))
+
+
+@jobs.route('/jobs/<int:job_id>/download')
+def download(job_id):
+    """The rendered PDF once the job is done; 202 with a Refresh header until then.
+
+    Browsers honour Refresh, so following a link here simply waits for the
+    invoice and then downloads it.
+    """
+    job = RenderJob.query.get_or_404(job_id)
+    if job.status == 'failed':
+        return jsonify(_job_json(job)), 500
+
+    pdf = _cache().get(job.entry_id, job.cache_key) if job.status == 'done' else None
+    if pdf is None:
+        if job.status == 'done':
+            # Evicted from the cache since it was rendered: render it again
+            run_write(_set_status, job.id, 'queued')
+        return Response('Your invoice is being prepared; this page will refresh.\n', status=202,
+                        mimetype='text/plain', headers={'Refresh': '1', 'Retry-After': '1'})
+
+    entry = db.session.get(RentEntry, job.entry_id)
+    name = invoice_filename(entry) if entry else f'invoice_{job.entry_id}.pdf'
+    response = send_file(io.BytesIO(pdf), mimetype='application/pdf',
+                         as_attachment=True, download_name=name, etag=job.cache_key)
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,251 @@
+# ledger_io.py
+"""Bulk import and export of RentEntry rows as CSV or JSON Lines.
+
+Both directions stream: imports parse one row at a time and insert in
+fixed-size chunks, exports fetch rows in batches and yield text as they go,
+so neither ever holds the whole ledger in memory.
+"""
+
+import csv
+import io
+import json
+import math
+import time
+from datetime import datetime
+
+from database import run_write
+from meters import record_rows
+from models import db, RentEntry
+from tariffs import current_book
+
+FORMATS = ('csv', 'jsonl')
+
+# Column order of exports. water and electricity are the stored costs;
+# imports ignore them and recalculate from the counts and readings.
+EXPORT_FIELDS = [
+    'id', 'tenant_name', 'month', 'entry_date', 'rent',
+    'water_fill_count', 'water', 'waste',
+    'electricity_previous_reading', 'electricity_present_reading', 'electricity',
+    'repair', 'misc', 'total',
+]
+AMOUNT_FIELDS = ['rent', 'waste', 'electricity_previous_reading',
+                 'electricity_present_reading', 'repair', 'misc']
+
+MAX_REPORTED_ERRORS = 100
+
+
+class UnreadableFile(Exception):
+    """The import file cannot be decoded or parsed past `line_number`."""
+
+    def __init__(self, line_number, reason):
+        super().__init__(f'line {line_number}: {reason}')
+        self.line_number = line_number
+        self.reason = reason
+
+
+def decoded_lines(stream):
+    """Yield the lines of a binary stream as text, decoding one line at a time."""
+    for line_number, line in enumerate(stream, start=1):
+        try:
+            yield line.decode('utf-8-sig' if line_number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            raise UnreadableFile(line_number, 'not valid UTF-8 text') from None
+
+
+def read_rows(stream, fmt):
+    """Yield (line_number, dict) from a binary CSV or JSON Lines stream.
+
+    Raises UnreadableFile at the first line that is not UTF-8 or not valid
+    CSV; reading cannot carry on past that point.
+    """
+    lines = decoded_lines(stream)
+    if fmt == 'csv':
+        lines_read = 0
+
+        def counted(lines):
+            nonlocal lines_read
+            for lines_read, line in enumerate(lines, start=1):
+                yield line
+
+        reader = csv.DictReader(counted(lines))
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except csv.Error as e:
+            # reader.line_num may not count the line that failed yet
+            raise UnreadableFile(lines_read, f'malformed CSV: {e}') from None
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = e
+            yield line_number, row
+
+
+def validate_row(row, book):
+    """Turn one raw import row into RentEntry column values.
+
+    Raises ValueError describing the first problem found. Water and
+    electricity costs are priced with `book`, the TariffBook the entry form
+    also uses.
+    """
+    if isinstance(row, Exception):
+        raise ValueError(f'invalid JSON: {row}')
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object')
+
+    values = {}
+    for field, limit in (('tenant_name', 100), ('month', 50)):
+        value = str(row.get(field) or '').strip()
+        if not value:
+            raise ValueError(f'{field} is required')
+        if len(value) > limit:
+            raise ValueError(f'{field} is longer than {limit} characters')
+        values[field] = value
+
+    try:
+        values['entry_date'] = datetime.strptime(str(row.get('entry_date') or ''), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('entry_date must be a YYYY-MM-DD date') from None
+
+    for field in AMOUNT_FIELDS:
+        try:
+            values[field] = float(row.get(field) or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number') from None
+        # float() accepts 'nan' and 'inf', which the database and JSON cannot hold
+        if not math.isfinite(values[field]):
+            raise ValueError(f'{field} must be a finite number')
+
+    try:
+        values['water_fill_count'] = int(float(row.get('water_fill_count') or 0))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('water_fill_count must be a whole number') from None
+    if values['water_fill_count'] < 0:
+        raise ValueError('water_fill_count cannot be negative')
+
+    values['water'], values['electricity'] = book.charges(
+        values['entry_date'],
+        values['water_fill_count'],
+        values['electricity_previous_reading'],
+        values['electricity_present_reading'],
+    )
+    return values
+
+
+class ImportResult:
+    """Outcome of an import: rows inserted, rows rejected, and why.
+
+    `complete` is False when the file became unreadable part way through.
+    The rows before that point are imported; the rest of the file is not.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.rejected = 0
+        self.alerts = 0     # rows flagged for unusual electricity usage
+        self.errors = []    # (line_number, message), at most MAX_REPORTED_ERRORS
+        self.complete = True
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.inserted / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'alerts': self.alerts,
+            'complete': self.complete,
+            'errors': [{'line': line, 'error': message} for line, message in self.errors],
+            'seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+def import_rows(rows, batch_size=5000):
+    """Validate and insert (line_number, row) pairs, one transaction per batch.
+
+    Each batch is a single executemany() INSERT, bypassing the ORM unit of
+    work, committed through run_write() so a busy database is retried.
+    Invalid rows are skipped and reported; valid rows around them are
+    still imported. The INSERT returns the new rows, so the same transaction
+    also updates the tenants' meters (see meters.record_rows).
+    """
+    result = ImportResult()
+    book = current_book()
+    table = RentEntry.__table__
+    # Multi-row INSERT ... RETURNING gives rows back in no particular order,
+    # so it returns everything the meters need, not just the new ids
+    insert = table.insert().returning(table.c.id, table.c.tenant_name, table.c.entry_date,
+                                      table.c.electricity_previous_reading,
+                                      table.c.electricity_present_reading)
+    batch = []
+
+    def write():
+        return record_rows(db.session.execute(insert, batch).mappings().all())
+
+    def flush():
+        result.alerts += run_write(write)
+        result.inserted += len(batch)
+        batch.clear()
+
+    try:
+        for line_number, row in rows:
+            try:
+                batch.append(validate_row(row, book))
+            except ValueError as e:
+                result.rejected += 1
+                if len(result.errors) < MAX_REPORTED_ERRORS:
+                    result.errors.append((line_number, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+    except UnreadableFile as e:
+        # Keep the rows before the bad line, as already-committed batches are kept
+        result.complete = False
+        result.errors.append((e.line_number, f'{e.reason}; the rest of the file was not imported'))
+    if batch:
+        flush()
+
+    result.elapsed = time.perf_counter() - result.started
+    return result
+
+
+def export_rows(fmt, tenant=None, month=None, batch_size=2000):
+    """Yield the ledger as CSV or JSON Lines text, oldest entry first.
+
+    Rows come straight from the cursor in batches of `batch_size`, as plain
+    tuples rather than ORM objects.
+    """
+    columns = [getattr(RentEntry, field) for field in EXPORT_FIELDS]
+    query = db.select(*columns).order_by(RentEntry.entry_date, RentEntry.id)
+    if tenant:
+        query = query.where(RentEntry.tenant_name == tenant)
+    if month:
+        query = query.where(RentEntry.month == month)
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+
+    for rows in result.partitions():
+        for row in rows:
+            if writer:
+                writer.writerow(row)
+            else:
+                record = dict(zip(EXPORT_FIELDS, row))
+                record['entry_date'] = record['entry_date'].isoformat()
+                buffer.write(json.dumps(record))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,306 @@
+# meters.py
+"""Tenant meter history: latest readings and usage anomaly detection.
+
+Every tenant gets a Tenant row and one electricity Meter. The meter stores
+the tenant's latest reading, so a new entry's previous reading is a single
+indexed lookup instead of a search through past entries. It also keeps an
+exponentially weighted mean and variance of the units billed per entry.
+These are updated in O(1) as each entry arrives. Usage more than ANOMALY_Z
+standard deviations from the tenant's mean is recorded as a UsageAlert.
+
+`flask meters backfill` rebuilds all of this from the existing ledger in a
+single streaming pass.
+"""
+
+import math
+import time
+from datetime import datetime
+
+import click
+from flask import Blueprint, abort, jsonify, request
+
+from database import run_write
+from models import db, Meter, RentEntry, Tenant, UsageAlert
+
+# Weight of the newest entry in the running statistics: roughly the last
+# ten entries count, so a tenant's usage can drift without raising alerts.
+STATS_ALPHA = 0.2
+ANOMALY_Z = 3.0
+# No alerts until a tenant has this many entries
+MIN_READINGS = 6
+# Floor for the standard deviation, so a tenant with very steady usage is
+# not flagged for a few units either way
+MIN_SPREAD_UNITS = 10.0
+
+
+METER_FIELDS = ('latest_reading', 'latest_date', 'readings', 'mean_units', 'var_units')
+
+
+def new_meter(**values):
+    # Column defaults only apply on INSERT, and observe() needs them before that
+    return Meter(**{'readings': 0, 'mean_units': 0.0, 'var_units': 0.0, **values})
+
+
+class MeterState:
+    """A plain copy of a Meter's reading and statistics columns.
+
+    Bulk imports and the backfill call observe() once per entry, and
+    setting these slots is much cheaper than setting ORM attributes.
+    """
+
+    __slots__ = ('tenant_id',) + METER_FIELDS
+
+    def __init__(self, tenant_id, meter=None):
+        self.tenant_id = tenant_id
+        meter = meter or new_meter()
+        for field in METER_FIELDS:
+            setattr(self, field, getattr(meter, field))
+
+    def values(self):
+        return {field: getattr(self, field) for field in METER_FIELDS}
+
+
+def observe(meter, entry_date, previous_reading, present_reading):
+    """Fold one entry into `meter`'s latest reading and usage statistics.
+
+    The entry is scored against the statistics as they were before it.
+    Returns alert values (entry_date, units, expected_units, z_score) if
+    the usage is abnormal, else None. Abnormal usage is clipped to
+    ANOMALY_Z deviations before it joins the statistics, so one mistyped
+    reading cannot hide the next. An entry dated before the meter's latest
+    one still counts towards the statistics but does not move the latest
+    reading. A present reading below the previous one (a blank field, a
+    typo or a new meter) is ignored.
+    """
+    if present_reading < previous_reading:
+        return None
+    units = present_reading - previous_reading
+    alert = None
+    if meter.readings >= MIN_READINGS:
+        spread = max(math.sqrt(meter.var_units), MIN_SPREAD_UNITS)
+        z_score = (units - meter.mean_units) / spread
+        if abs(z_score) >= ANOMALY_Z:
+            alert = {'entry_date': entry_date, 'units': units,
+                     'expected_units': meter.mean_units, 'z_score': z_score}
+            units = meter.mean_units + math.copysign(ANOMALY_Z * spread, z_score)
+
+    if meter.readings == 0:
+        meter.mean_units, meter.var_units = units, 0.0
+    else:
+        delta = units - meter.mean_units
+        meter.mean_units += STATS_ALPHA * delta
+        meter.var_units = (1 - STATS_ALPHA) * (meter.var_units + STATS_ALPHA * delta * delta)
+    meter.readings += 1
+
+    if meter.latest_date is None or entry_date >= meter.latest_date:
+        meter.latest_date, meter.latest_reading = entry_date, present_reading
+    return alert
+
+
+def meter_for(tenant_name, create=False):
+    """The tenant's Meter, by name; with create=True a new tenant gets one."""
+    meter = db.session.execute(
+        db.select(Meter).join(Tenant).where(Tenant.name == tenant_name)
+    ).scalar_one_or_none()
+    if meter is None and create:
+        meter = new_meter()
+        db.session.add(Tenant(name=tenant_name, meter=meter))
+        db.session.flush()
+    return meter
+
+
+def carries_over(meter, entry_date):
+    """Whether an entry dated `entry_date` can take the meter's latest
+    reading as its previous reading.
+
+    Not for a back-dated entry: the latest reading was taken after it.
+    """
+    return (meter.latest_reading is not None
+            and (entry_date is None or entry_date >= meter.latest_date))
+
+
+def latest_reading(tenant_name, entry_date=None):
+    """The previous reading for the tenant's next entry, dated `entry_date`.
+
+    None for a new tenant, or if the entry is back-dated (see carries_over).
+    """
+    meter = db.session.execute(
+        db.select(Meter.latest_reading, Meter.latest_date).join(Tenant).where(Tenant.name == tenant_name)
+    ).first()
+    return meter.latest_reading if meter and carries_over(meter, entry_date) else None
+
+
+def record_entry(entry):
+    """Update the tenant's meter for a new entry, in the caller's transaction.
+
+    Returns the UsageAlert if the entry's usage is abnormal, else None.
+    """
+    db.session.flush()
+    meter = meter_for(entry.tenant_name, create=True)
+    values = observe(meter, entry.entry_date,
+                     entry.electricity_previous_reading, entry.electricity_present_reading)
+    if values is None:
+        return None
+    alert = UsageAlert(tenant_id=meter.tenant_id, entry_id=entry.id, **values)
+    db.session.add(alert)
+    return alert
+
+
+def record_rows(rows):
+    """record_entry() for a batch of inserted rows (mappings including 'id').
+
+    Loads every meter the batch needs with one query and adds the alerts
+    in bulk. Returns the number of alerts.
+    """
+    names = {row['tenant_name'] for row in rows}
+    meters = {name: meter for name, meter in db.session.execute(
+        db.select(Tenant.name, Meter).join(Tenant.meter).where(Tenant.name.in_(names)))}
+    for name in names - meters.keys():
+        meters[name] = new_meter()
+        db.session.add(Tenant(name=name, meter=meters[name]))
+    db.session.flush()
+    states = {name: MeterState(meter.tenant_id, meter) for name, meter in meters.items()}
+
+    alerts = []
+    for row in sorted(rows, key=lambda row: (row['entry_date'], row['id'])):
+        state = states[row['tenant_name']]
+        values = observe(state, row['entry_date'],
+                         row['electricity_previous_reading'], row['electricity_present_reading'])
+        if values is not None:
+            alerts.append(dict(values, tenant_id=state.tenant_id, entry_id=row['id']))
+
+    for name, state in states.items():
+        for field, value in state.values().items():
+            setattr(meters[name], field, value)
+    if alerts:
+        db.session.execute(UsageAlert.__table__.insert(), alerts)
+    return len(alerts)
+
+
+def forget_entry(entry):
+    """Call after deleting `entry`: drops its alerts and, if it was the
+    tenant's latest entry, moves the meter back to the latest one left.
+
+    The usage statistics are not rewound; `flask meters backfill`
+    recomputes them exactly.
+    """
+    db.session.flush()
+    db.session.execute(db.delete(UsageAlert).where(UsageAlert.entry_id == entry.id))
+    meter = meter_for(entry.tenant_name)
+    if meter is None or meter.latest_date is None or entry.entry_date < meter.latest_date:
+        return
+    previous = (db.select(RentEntry.entry_date, RentEntry.electricity_present_reading)
+                .where(RentEntry.tenant_name == entry.tenant_name,
+                       RentEntry.electricity_present_reading >= RentEntry.electricity_previous_reading)
+                .order_by(RentEntry.entry_date.desc(), RentEntry.id.desc()).limit(1))
+    row = db.session.execute(previous).first()
+    meter.latest_date, meter.latest_reading = row if row else (None, None)
+
+
+def backfill(batch_size=10_000):
+    """Rebuild every Tenant, Meter and UsageAlert from the ledger.
+
+    Reads the entries once, oldest first, `batch_size` rows at a time, and
+    feeds them through observe() exactly as if they had been added one by
+    one. Only the per-tenant state and the alerts are kept in memory. The
+    old rows are replaced in a single transaction. Returns (entries
+    scanned, tenants, alerts, seconds).
+    """
+    started = time.perf_counter()
+    table = RentEntry.__table__
+    query = (db.select(table.c.id, table.c.tenant_name, table.c.entry_date,
+                       table.c.electricity_previous_reading, table.c.electricity_present_reading)
+             .order_by(table.c.entry_date, table.c.id))
+
+    meters, alerts = {}, []
+    scanned = 0
+    for rows in db.session.execute(query.execution_options(yield_per=batch_size)).partitions():
+        for entry_id, name, entry_date, previous, present in rows:
+            meter = meters.get(name)
+            if meter is None:
+                meter = meters[name] = MeterState(tenant_id=len(meters) + 1)
+            values = observe(meter, entry_date, previous, present)
+            if values is not None:
+                alerts.append(dict(values, tenant_id=meter.tenant_id, entry_id=entry_id))
+        scanned += len(rows)
+
+    def write():
+        for model in (UsageAlert, Meter, Tenant):
+            db.session.execute(db.delete(model))
+        if meters:
+            db.session.execute(Tenant.__table__.insert(),
+                               [{'id': meter.tenant_id, 'name': name} for name, meter in meters.items()])
+            db.session.execute(Meter.__table__.insert(),
+                               [dict(meter.values(), tenant_id=meter.tenant_id) for meter in meters.values()])
+        if alerts:
+            db.session.execute(UsageAlert.__table__.insert(), alerts)
+
+    run_write(write)
+    return scanned, len(meters), len(alerts), time.perf_counter() - started
+
+
+# --- Routes ---
+meter_routes = Blueprint('meters', __name__, url_prefix='/tenants')
+
+
+def _meter_json(name, meter, entry_date=None):
+    return {
+        'tenant': name,
+        'latest_reading': meter.latest_reading,
+        'carries_over': carries_over(meter, entry_date),
+        'latest_date': meter.latest_date.isoformat() if meter.latest_date else None,
+        'readings': meter.readings,
+        'mean_units': round(meter.mean_units, 2),
+        'std_units': round(math.sqrt(meter.var_units), 2),
+    }
+
+
+@meter_routes.route('')
+def list_tenants():
+    rows = db.session.execute(db.select(Tenant.name, Meter).join(Tenant.meter).order_by(Tenant.name))
+    return jsonify([_meter_json(name, meter) for name, meter in rows])
+
+
+@meter_routes.route('/latest')
+def tenant_latest():
+    """?name=<tenant>&date=<entry date>: the latest reading, used to pre-fill
+    the entry form. carries_over is false if the entry would be back-dated.
+    """
+    name = request.args.get('name', '').strip()
+    date = request.args.get('date', '')
+    try:
+        entry_date = datetime.strptime(date, '%Y-%m-%d').date() if date else None
+    except ValueError:
+        abort(400, description=f'Invalid date: {date!r}')
+    meter = meter_for(name) if name else None
+    if meter is None:
+        abort(404)
+    return jsonify(_meter_json(name, meter, entry_date))
+
+
+@meter_routes.route('/alerts')
+def usage_alerts():
+    """Newest usage alerts first, optionally for one ?tenant=."""
+    query = (db.select(Tenant.name, UsageAlert).select_from(UsageAlert)
+             .join(Tenant, Tenant.id == UsageAlert.tenant_id)
+             .order_by(UsageAlert.entry_date.desc(), UsageAlert.id.desc())
+             .limit(min(max(request.args.get('limit', 100, type=int), 1), 1000)))
+    tenant = request.args.get('tenant', '').strip()
+    if tenant:
+        query = query.where(Tenant.name == tenant)
+    return jsonify([{
+        'tenant': name,
+        'entry_id': alert.entry_id,
+        'entry_date': alert.entry_date.isoformat(),
+        'units': alert.units,
+        'expected_units': round(alert.expected_units, 2),
+        'z_score': round(alert.z_score, 2),
+    } for name, alert in db.session.execute(query)])
+
+
+@meter_routes.cli.command('backfill')
+@click.option('--batch-size', default=10_000, show_default=True)
+def backfill_command(batch_size):
+    """Rebuild tenants, meters and usage alerts from the existing entries."""
+    scanned, tenants, alerts, seconds = backfill(batch_size)
+    print(f'Backfilled {tenants} tenants from {scanned} entries ({alerts} alerts) in {seconds:.2f}s.')
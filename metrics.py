@@ -0,0 +1,346 @@
+# metrics.py
+"""Low-overhead request, SQL and PDF instrumentation in Prometheus text format.
+
+Recording a sample is a dict lookup, a bisect and a few additions under a
+lock, so the instrumentation stays on in production. GET /metrics serves:
+
+* http_request_duration_seconds{method,route,status}  (histogram)
+* http_request_db_queries{route}                      (histogram, queries per request)
+* db_query_duration_seconds{statement}                (histogram)
+* pdf_render_seconds / pdf_size_bytes{mode}           (histograms)
+* pdf_cache_hits_total{tier} / pdf_cache_misses_total (counters; hit ratio in PromQL)
+* render_jobs{status}                                 (gauge; status="queued" is the queue depth)
+
+Each process keeps its own registry. If METRICS_DIR is set, every Gunicorn
+worker and background render worker also writes a snapshot there at most
+every METRICS_FLUSH_SECONDS seconds, and /metrics serves the sum over all
+live processes.
+
+Setting PROFILING_ENABLED also lets a request carry ?_profile=1. It is
+then sampled by a background thread, and the folded stacks are written to
+PROFILE_DIR, ready for flamegraph.pl or speedscope.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (5_000, 10_000, 20_000, 50_000, 100_000, 500_000, 1_000_000)
+
+
+class Metric:
+    """Base for metrics holding one value (or bucket set) per label tuple."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _label_text(self, labels, extra=None):
+        pairs = list(zip(self.label_names, labels))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(labels): value for labels, value in self._values.items()}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, *labels, value):
+        """For counters kept elsewhere (e.g. PdfCache.hits), copied in at scrape time."""
+        with self._lock:
+            self._values[labels] = value
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def render(self, values):
+        for labels, value in values.items():
+            yield f'{self.name}{self._label_text(json.loads(labels))} {value}'
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    render = Counter.render
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [per-bucket counts incl. +Inf, sum, count]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def render(self, values):
+        for labels, (counts, total, count) in values.items():
+            labels = json.loads(labels)
+            cumulative = 0
+            for bound, n in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += n
+                yield f'{self.name}_bucket{self._label_text(labels, ("le", bound))} {cumulative}'
+            yield f'{self.name}_sum{self._label_text(labels)} {total}'
+            yield f'{self.name}_count{self._label_text(labels)} {count}'
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []    # callables run just before each scrape
+        # (gauge, collect) pairs read from shared state such as the database.
+        # Every process would report the same value, so these are collected
+        # once per scrape and never summed across snapshots.
+        self.shared = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_shared(self, gauge, collect):
+        self.shared.append((gauge, collect))
+        return gauge
+
+    def snapshot(self):
+        for collect in self.collectors:
+            collect()
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def render(self, snapshots):
+        """Prometheus text for the sum of one or more snapshots."""
+        lines = []
+        for metric in self.metrics:
+            merged = {}
+            for snapshot in snapshots:
+                for labels, value in snapshot.get(metric.name, {}).items():
+                    merged[labels] = metric.merge(merged[labels], value) if labels in merged else value
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(merged))
+        for gauge, collect in self.shared:
+            collect()
+            lines.append(f'# HELP {gauge.name} {gauge.help}')
+            lines.append(f'# TYPE {gauge.name} {gauge.kind}')
+            lines.extend(gauge.render(gauge.snapshot()))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_latency = registry.add(Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request.', ('method', 'route', 'status')))
+request_queries = registry.add(Histogram(
+    'http_request_db_queries', 'SQL statements executed per request.', ('route',), COUNT_BUCKETS))
+query_latency = registry.add(Histogram(
+    'db_query_duration_seconds', 'SQL statement execution time.', ('statement',), QUERY_BUCKETS))
+pdf_render_time = registry.add(Histogram(
+    'pdf_render_seconds', 'Time to render an invoice PDF.', ('mode',)))
+pdf_size = registry.add(Histogram(
+    'pdf_size_bytes', 'Size of rendered invoice PDFs.', ('mode',), SIZE_BUCKETS))
+cache_hits = registry.add(Counter(
+    'pdf_cache_hits_total', 'Invoice cache hits.', ('tier',)))
+cache_misses = registry.add(Counter(
+    'pdf_cache_misses_total', 'Invoice cache misses.'))
+
+
+def observe_render(mode, seconds, pdf):
+    pdf_render_time.observe(seconds, mode)
+    pdf_size.observe(len(pdf), mode)
+
+
+def timed_render(mode, render, *args):
+    """Call render(*args), record its duration and output size, return the PDF."""
+    started = time.perf_counter()
+    pdf = render(*args)
+    observe_render(mode, time.perf_counter() - started, pdf)
+    return pdf
+
+
+# --- Flask / SQLAlchemy wiring ---
+def init_metrics(app, engine, pdf_cache=None):
+    """Install request hooks, SQL event listeners and the /metrics route."""
+    app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR'))
+    app.config.setdefault('METRICS_FLUSH_SECONDS', 5)
+    app.config.setdefault('PROFILING_ENABLED', os.environ.get('PROFILING_ENABLED', '0') == '1')
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        query_latency.observe(elapsed, statement.lstrip()[:6].upper())
+        if has_request_context() and 'db_queries' in g:
+            g.db_queries += 1
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        if app.config['PROFILING_ENABLED'] and request.args.get('_profile') == '1':
+            g.profiler = SamplingProfiler(threading.get_ident())
+            g.profiler.start()
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_latency.observe(time.perf_counter() - g.request_started,
+                                request.method, route, response.status_code)
+        request_queries.observe(g.db_queries, route)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            response.headers['X-Profile'] = profiler.stop_and_save(app.config['PROFILE_DIR'], route)
+
+        flush_if_due(app)
+        return response
+
+    if pdf_cache is not None:
+        def collect_cache_counters():
+            for tier, hits in pdf_cache.hits.items():
+                cache_hits.set_total(tier, value=hits)
+            cache_misses.set_total(value=pdf_cache.misses)
+        registry.collectors.append(collect_cache_counters)
+
+    @app.route('/metrics')
+    def metrics():
+        directory = app.config['METRICS_DIR']
+        if directory:
+            write_snapshot(directory)
+            snapshots = read_snapshots(directory)
+        else:
+            snapshots = [registry.snapshot()]
+        return Response(registry.render(snapshots), mimetype='text/plain; version=0.0.4')
+
+
+# --- Multi-process aggregation ---
+_last_flush = 0.0
+
+def flush_if_due(app):
+    """Write this process's snapshot to METRICS_DIR if the last one is stale."""
+    global _last_flush
+    directory = app.config.get('METRICS_DIR')
+    if directory and time.monotonic() - _last_flush > app.config['METRICS_FLUSH_SECONDS']:
+        _last_flush = time.monotonic()
+        write_snapshot(directory)
+
+
+def write_snapshot(directory):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def read_snapshots(directory):
+    """Load every live worker's snapshot, deleting those of exited processes."""
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            os.kill(int(name[:-5]), 0)
+        except (ValueError, ProcessLookupError):
+            os.remove(path)
+            continue
+        except PermissionError:
+            pass
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+# --- Sampling profiler ---
+class SamplingProfiler:
+    """Samples one thread's stack every `interval` seconds from a helper thread.
+
+    Unlike cProfile it adds no per-call overhead to the profiled code, and
+    only runs for requests that ask for it.
+    """
+
+    def __init__(self, thread_id, interval=0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop_and_save(self, directory, route):
+        """Stop sampling and write folded stacks; returns the file name."""
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(directory, exist_ok=True)
+        slug = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'index'
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{slug}.folded'
+        with open(os.path.join(directory, name), 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        return name
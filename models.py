@@ -0,0 +1,184 @@
+# models.py
+
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.ext.hybrid import hybrid_property
+
+db = SQLAlchemy()
+
+# --- Database Model Definition ---
+# UPDATED: Changed 'water' to 'water_fill_count' and added 'water_cost'
+class RentEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_name = db.Column(db.String(100), nullable=False)
+    month = db.Column(db.String(50), nullable=False)
+    entry_date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    rent = db.Column(db.Float, nullable=False, default=0)
+   
+    # New: Store the count, then calculate the cost
+    water_fill_count = db.Column(db.Integer, nullable=False, default=0)
+    water = db.Column(db.Float, nullable=False, default=0) # This will store the CALCULATED water cost
+
+    waste = db.Column(db.Float, nullable=False, default=0)
+    
+    electricity_previous_reading = db.Column(db.Float, nullable=False, default=0)
+    electricity_present_reading = db.Column(db.Float, nullable=False, default=0)
+    electricity = db.Column(db.Float, nullable=False, default=0) 
+    
+    repair = db.Column(db.Float, nullable=False, default=0)
+    misc = db.Column(db.Float, nullable=False, default=0)
+
+    # Indexes backing the keyset-paginated ledger in index(): every listing is
+    # ordered by (entry_date, id), optionally filtered by tenant or month.
+    __table_args__ = (
+        db.Index('ix_rent_entry_date_id', 'entry_date', 'id'),
+        db.Index('ix_rent_entry_tenant_date_id', 'tenant_name', 'entry_date', 'id'),
+        db.Index('ix_rent_entry_month_date_id', 'month', 'entry_date', 'id'),
+    )
+    
+    # Calculate total on the fly. As a hybrid it also works as a SQL
+    # expression, e.g. db.func.sum(RentEntry.total), so reports can total
+    # rows in the database instead of loading them.
+    @hybrid_property
+    def total(self):
+        return self.rent + self.water + self.waste + self.electricity + self.repair + self.misc
+
+    # Billed units: a present reading below the previous one bills nothing
+    @hybrid_property
+    def units_consumed(self):
+        return max(self.electricity_present_reading - self.electricity_previous_reading, 0)
+
+    @units_consumed.expression
+    def units_consumed(cls):
+        difference = cls.electricity_present_reading - cls.electricity_previous_reading
+        return db.case((difference > 0, difference), else_=0)
+
+    def __repr__(self):
+        return f'<RentEntry for {self.tenant_name}>'
+
+    @property
+    def cursor(self):
+        """Keyset pagination cursor for this row, e.g. '2024-05-01_42'."""
+        return f'{self.entry_date.isoformat()}_{self.id}'
+
+
+# --- Tariffs ---
+# Effective-dated rate tables for the metered utilities. A tariff applies to
+# entries dated on or after effective_from until the next tariff for the same
+# utility takes over. Tariffs are never edited in place: a rate change is a
+# new tariff, so history can always be re-priced. See tariffs.py.
+class Tariff(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    utility = db.Column(db.String(20), nullable=False)     # 'water' or 'electricity'
+    effective_from = db.Column(db.Date, nullable=False)
+    name = db.Column(db.String(100), nullable=False, default='')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    slabs = db.relationship('TariffSlab', backref='tariff', cascade='all, delete-orphan',
+                            order_by='TariffSlab.id')
+
+    __table_args__ = (
+        db.UniqueConstraint('utility', 'effective_from'),
+    )
+
+    def __repr__(self):
+        return f'<Tariff {self.utility} from {self.effective_from}>'
+
+
+class TariffSlab(db.Model):
+    """One tier of a tariff: `rate` per unit for usage up to `up_to` units.
+
+    The slab starts where the previous one ends (0 for the first); the last
+    slab has up_to = NULL and covers everything above. Water is billed per
+    tanker fill with a single slab.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    tariff_id = db.Column(db.Integer, db.ForeignKey('tariff.id'), nullable=False, index=True)
+    up_to = db.Column(db.Float, nullable=True)
+    rate = db.Column(db.Float, nullable=False)
+
+
+# --- Render Jobs ---
+# Queue of invoices waiting to be rendered by the background workers in
+# jobs.py. Finished PDFs live in the invoice cache, not in this table.
+class RenderJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, nullable=False)
+    cache_key = db.Column(db.String(32), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')   # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(50), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_render_job_status_id', 'status', 'id'),
+        db.Index('ix_render_job_entry_key', 'entry_id', 'cache_key'),
+    )
+
+    def __repr__(self):
+        return f'<RenderJob {self.id} {self.status}>'
+
+
+# --- Tenants and meters ---
+# Entries still carry the tenant's name; Tenant.name is the link. Each tenant
+# has one electricity Meter holding its latest reading and running usage
+# statistics, kept up to date as entries are added. See meters.py.
+class Tenant(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    meter = db.relationship('Meter', backref='tenant', uselist=False, cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<Tenant {self.name}>'
+
+
+class Meter(db.Model):
+    """A tenant's electricity meter.
+
+    latest_reading/latest_date come from the tenant's most recent entry.
+    mean_units/var_units are an exponentially weighted mean and variance of
+    the units billed per entry, over `readings` entries.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenant.id'), nullable=False, unique=True)
+    latest_reading = db.Column(db.Float, nullable=True)
+    latest_date = db.Column(db.Date, nullable=True)
+    readings = db.Column(db.Integer, nullable=False, default=0)
+    mean_units = db.Column(db.Float, nullable=False, default=0)
+    var_units = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Meter for tenant {self.tenant_id}>'
+
+
+class UsageAlert(db.Model):
+    """An entry whose electricity usage was far from the tenant's usual."""
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenant.id'), nullable=False)
+    entry_id = db.Column(db.Integer, nullable=False, index=True)
+    entry_date = db.Column(db.Date, nullable=False)
+    units = db.Column(db.Float, nullable=False)
+    expected_units = db.Column(db.Float, nullable=False)
+    z_score = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_usage_alert_tenant_date', 'tenant_id', 'entry_date'),
+    )
+
+    def __repr__(self):
+        return f'<UsageAlert entry {self.entry_id} z={self.z_score:.1f}>'
+
+
+def init_db():
+    """Create missing tables, and missing indexes on tables that already exist."""
+    db.create_all()
+    # create_all() only emits CREATE INDEX for tables it creates itself, so an
+    # existing rent.db would never pick up indexes added to the model later.
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
@@ -0,0 +1,194 @@
+# pdf_cache.py
+"""Two-tier cache of rendered invoice PDFs.
+
+Invoices are content-addressed: the key is a hash of every field drawn on the
+invoice plus invoice.TEMPLATE_VERSION, so an edited entry simply gets a new
+key and can never be served a stale PDF. invalidate() exists to free the space
+held by a deleted or edited entry straight away instead of waiting for
+eviction.
+
+Tier 1 is an in-process LRU bounded by total bytes. Tier 2 is a directory of
+`<entry_id>/<key>.pdf` files shared by every worker process, bounded by total
+bytes and evicted least-recently-used first (hits refresh a file's mtime).
+One subdirectory per entry keeps invalidate() from listing the whole cache.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from invoice import TEMPLATE_VERSION
+
+
+def cache_key(entry):
+    """Content hash of an InvoiceData snapshot; also used as the HTTP ETag."""
+    digest = hashlib.sha256(TEMPLATE_VERSION.encode())
+    digest.update(repr(tuple(entry)).encode())
+    return digest.hexdigest()[:32]
+
+
+class PdfCache:
+
+    def __init__(self, directory, memory_max_bytes, disk_max_bytes):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()    # (entry_id, key) -> pdf bytes
+        self._memory_bytes = 0
+        self._disk_bytes = None         # measured lazily on first write
+        self._lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+
+    def _path(self, entry_id, key):
+        return os.path.join(self.directory, str(entry_id), f'{key}.pdf')
+
+    def get(self, entry_id, key):
+        """Return the cached PDF bytes, or None on a miss."""
+        with self._lock:
+            pdf = self._memory.get((entry_id, key))
+            if pdf is not None:
+                self._memory.move_to_end((entry_id, key))
+                self.hits['memory'] += 1
+                return pdf
+
+        path = self._path(entry_id, key)
+        try:
+            with open(path, 'rb') as f:
+                pdf = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits['disk'] += 1
+            self._remember(entry_id, key, pdf)
+        return pdf
+
+    def contains(self, entry_id, key):
+        """Whether a PDF is cached, without reading it or counting a hit or miss."""
+        with self._lock:
+            if (entry_id, key) in self._memory:
+                return True
+        return os.path.exists(self._path(entry_id, key))
+
+    def put(self, entry_id, key, pdf):
+        with self._lock:
+            self._remember(entry_id, key, pdf)
+        self._write_disk(entry_id, key, pdf)
+
+    def invalidate(self, entry_id):
+        """Drop every cached PDF of an entry, in this process and on disk."""
+        with self._lock:
+            for cached in [k for k in self._memory if k[0] == entry_id]:
+                self._memory_bytes -= len(self._memory.pop(cached))
+        entry_dir = os.path.join(self.directory, str(entry_id))
+        try:
+            with os.scandir(entry_dir) as files:
+                for file in files:
+                    if file.name.endswith('.pdf'):
+                        self._remove(file.path)
+        except FileNotFoundError:
+            return
+        self._remove_dir(entry_dir)
+
+    def _remember(self, entry_id, key, pdf):
+        """Insert into the memory tier; caller holds the lock."""
+        if len(pdf) > self.memory_max_bytes:
+            return
+        old = self._memory.pop((entry_id, key), None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[(entry_id, key)] = pdf
+        self._memory_bytes += len(pdf)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _write_disk(self, entry_id, key, pdf):
+        path = self._path(entry_id, key)
+        entry_dir = os.path.dirname(path)
+        # Write-then-rename so other workers never read a half-written file
+        while True:
+            os.makedirs(entry_dir, exist_ok=True)
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+                break
+            except FileNotFoundError:
+                pass    # another worker removed the empty directory just now
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._measure_disk()
+            else:
+                self._disk_bytes += len(pdf)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _measure_disk(self):
+        return sum(stat.st_size for stat, _ in self._cached_files())
+
+    def _cached_files(self):
+        """(stat, path) of every cached PDF, skipping files that vanish mid-scan.
+
+        Also picks up `<entry_id>-<key>.pdf` files left at the top level by
+        the old flat layout, so eviction clears them out.
+        """
+        def scan(directory, depth):
+            try:
+                with os.scandir(directory) as files:
+                    entries = list(files)
+            except FileNotFoundError:
+                return
+            for f in entries:
+                try:
+                    if f.name.endswith('.pdf'):
+                        yield f.stat(), f.path
+                    elif depth == 0 and f.is_dir():
+                        yield from scan(f.path, 1)
+                except FileNotFoundError:
+                    # Evicted or invalidated by another worker since the listing
+                    pass
+
+        return list(scan(self.directory, 0))
+
+    def _evict_disk(self):
+        """Delete least-recently-used files until the tier is under 90% of its limit.
+
+        Rescans the directory rather than trusting _disk_bytes, since other
+        worker processes write to the same directory.
+        """
+        cached = self._cached_files()
+        cached.sort(key=lambda item: item[0].st_mtime)
+        total = sum(stat.st_size for stat, _ in cached)
+        target = self.disk_max_bytes * 0.9
+        for stat, path in cached:
+            if total <= target:
+                break
+            self._remove(path)
+            self._remove_dir(os.path.dirname(path))
+            total -= stat.st_size
+        self._disk_bytes = total
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _remove_dir(self, path):
+        """Remove an entry's directory if it is now empty."""
+        if path == self.directory:
+            return
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass    # not empty (another worker wrote to it) or already gone
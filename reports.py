@@ -0,0 +1,102 @@
+# reports.py
+"""Aggregate reports, computed with SQL GROUP BY rather than by loading rows.
+
+Every endpoint returns JSON and accepts the same optional filters:
+`tenant`, and `start` / `end` dates (YYYY-MM-DD, inclusive) on entry_date.
+"""
+
+from datetime import datetime
+
+from flask import Blueprint, abort, jsonify, request
+
+from models import db, RentEntry
+
+reports = Blueprint('reports', __name__, url_prefix='/reports')
+
+CATEGORIES = ('rent', 'water', 'waste', 'electricity', 'repair', 'misc')
+
+# strftime() formats for grouping entry_date by calendar period (SQLite)
+PERIODS = {'month': '%Y-%m', 'year': '%Y'}
+
+
+def _filtered(query):
+    """Apply the tenant/start/end filters from the query string."""
+    tenant = request.args.get('tenant', '').strip()
+    if tenant:
+        query = query.filter(RentEntry.tenant_name == tenant)
+    for arg, compare in (('start', RentEntry.entry_date.__ge__), ('end', RentEntry.entry_date.__le__)):
+        value = request.args.get(arg)
+        if value:
+            try:
+                query = query.filter(compare(datetime.strptime(value, '%Y-%m-%d').date()))
+            except ValueError:
+                abort(400, description=f'{arg} must be a YYYY-MM-DD date')
+    return query
+
+
+def _period():
+    by = request.args.get('by', 'month')
+    if by not in PERIODS:
+        abort(400, description=f"by must be one of: {', '.join(PERIODS)}")
+    return db.func.strftime(PERIODS[by], RentEntry.entry_date).label('period')
+
+
+@reports.route('/periods')
+def period_totals():
+    """Revenue per calendar month (?by=month) or year (?by=year)."""
+    period = _period()
+    rows = _filtered(db.session.query(
+        period,
+        db.func.count(RentEntry.id),
+        db.func.sum(RentEntry.total),
+    )).group_by(period).order_by(period)
+    return jsonify([{'period': p, 'entries': n, 'total': total} for p, n, total in rows])
+
+
+@reports.route('/tenants')
+def tenant_totals():
+    """Amount billed to each tenant, with their first and last entry dates."""
+    rows = _filtered(db.session.query(
+        RentEntry.tenant_name,
+        db.func.count(RentEntry.id),
+        db.func.sum(RentEntry.total),
+        db.func.min(RentEntry.entry_date),
+        db.func.max(RentEntry.entry_date),
+    )).group_by(RentEntry.tenant_name).order_by(RentEntry.tenant_name)
+    return jsonify([
+        {'tenant': tenant, 'entries': n, 'total': total,
+         'first_entry': first.isoformat(), 'last_entry': last.isoformat()}
+        for tenant, n, total, first, last in rows
+    ])
+
+
+@reports.route('/categories')
+def category_totals():
+    """Totals per charge category, per period when ?by=month|year is given."""
+    sums = [db.func.sum(getattr(RentEntry, name)) for name in CATEGORIES]
+    if 'by' not in request.args:
+        row = _filtered(db.session.query(*sums)).one()
+        return jsonify({name: value if value is not None else 0 for name, value in zip(CATEGORIES, row)})
+
+    period = _period()
+    rows = _filtered(db.session.query(period, *sums)).group_by(period).order_by(period)
+    return jsonify([
+        {'period': row[0], **{name: value for name, value in zip(CATEGORIES, row[1:])}}
+        for row in rows
+    ])
+
+
+@reports.route('/consumption')
+def electricity_consumption():
+    """Electricity units billed per period and tenant, for usage trends."""
+    period = _period()
+    rows = _filtered(db.session.query(
+        period,
+        RentEntry.tenant_name,
+        db.func.sum(RentEntry.units_consumed),
+        db.func.sum(RentEntry.electricity),
+    )).group_by(period, RentEntry.tenant_name).order_by(period, RentEntry.tenant_name)
+    return jsonify([
+        {'period': p, 'tenant': tenant, 'units': units, 'cost': cost}
+        for p, tenant, units, cost in rows
+    ])
@@ -0,0 +1,292 @@
+# tariffs.py
+"""Tariff engine: effective-dated, tiered utility rates.
+
+The Tariff/TariffSlab tables are compiled into a TariffBook, which prices an
+entry with two bisect lookups: one to find the tariff in force on the
+entry's date, one to find the slab the usage falls in, plus the cumulative
+cost of the slabs below it. The book is cached per process and rebuilt only
+when the tariff tables change.
+"""
+
+import math
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+import click
+from flask import Blueprint, abort, jsonify, request
+from sqlalchemy import bindparam
+
+from database import run_write
+from invoice import invoice_data
+from models import db, RentEntry, Tariff, TariffSlab
+
+UTILITIES = ('water', 'electricity')
+
+# The original flat rates, Nrs. 250 per water fill and Nrs. 13 per unit. They
+# apply to every entry dated before a utility's first tariff in the database.
+DEFAULT_RATES = {'water': 250.0, 'electricity': 13.0}
+UNIT_NAMES = {'water': 'fill', 'electricity': 'unit'}
+
+
+class CompiledTariff:
+    """One tariff's slabs, laid out for O(log n) pricing."""
+
+    __slots__ = ('utility', 'effective_from', 'bounds', 'rates', 'floors', 'base_costs')
+
+    def __init__(self, utility, effective_from, slabs):
+        """`slabs` is a list of (up_to, rate) with up_to=None for the open top slab."""
+        slabs = sorted(slabs, key=lambda slab: (slab[0] is None, slab[0] or 0))
+        self.utility = utility
+        self.effective_from = effective_from
+        self.bounds = [up_to for up_to, _ in slabs if up_to is not None]
+        self.rates = [rate for _, rate in slabs]
+        # floors[i] is where slab i starts; base_costs[i] what the slabs below it cost
+        self.floors = [0.0] + self.bounds
+        self.base_costs = [0.0]
+        for i, upper in enumerate(self.bounds):
+            self.base_costs.append(self.base_costs[-1] + (upper - self.floors[i]) * self.rates[i])
+
+    def cost(self, units):
+        if units <= 0:
+            return 0.0
+        i = min(bisect_left(self.bounds, units), len(self.rates) - 1)
+        return self.base_costs[i] + (units - self.floors[i]) * self.rates[i]
+
+    def describe(self):
+        """Human-readable rate, e.g. 'NRS 13.00/unit' or a list of tiers."""
+        unit = UNIT_NAMES[self.utility]
+        if len(self.rates) == 1:
+            return f'NRS {self.rates[0]:,.2f}/{unit}'
+        tiers = []
+        for floor, upper, rate in zip(self.floors, self.bounds + [None], self.rates):
+            span = f'{floor:g}-{upper:g}' if upper is not None else f'{floor:g}+'
+            tiers.append(f'{span} @ {rate:,.2f}')
+        return f"NRS/{unit}: {', '.join(tiers)}"
+
+    def to_json(self):
+        return [[upper, rate] for upper, rate in zip(self.bounds + [None], self.rates)]
+
+
+class TariffBook:
+    """Every tariff, per utility, sorted by effective date."""
+
+    def __init__(self, tariffs):
+        self._tariffs = {utility: [CompiledTariff(utility, date.min, [(None, DEFAULT_RATES[utility])])]
+                         for utility in UTILITIES}
+        for tariff in sorted(tariffs, key=lambda t: t.effective_from):
+            self._tariffs[tariff.utility].append(tariff)
+        self._dates = {utility: [t.effective_from for t in compiled]
+                       for utility, compiled in self._tariffs.items()}
+
+    def tariff(self, utility, on_date):
+        """The tariff in force on `on_date`."""
+        return self._tariffs[utility][bisect_right(self._dates[utility], on_date) - 1]
+
+    def charges(self, entry_date, water_fill_count, previous_reading, present_reading):
+        """Return (water_cost, electricity_cost) for an entry.
+
+        A present reading below the previous one bills no electricity.
+        """
+        water_cost = self.tariff('water', entry_date).cost(water_fill_count)
+        units_consumed = 0
+        if present_reading >= previous_reading:
+            units_consumed = present_reading - previous_reading
+        electricity_cost = self.tariff('electricity', entry_date).cost(units_consumed)
+        return water_cost, electricity_cost
+
+
+_book = None
+_book_version = None
+
+def current_book():
+    """Return the compiled TariffBook, recompiling only if the tables changed.
+
+    Tariffs are only ever added or removed, never edited. The row count
+    changes on every delete and the newest created_at on every add, so
+    together they identify the version. The highest id would not: SQLite
+    hands a deleted top id to the next row. Checking costs one small query.
+    """
+    global _book, _book_version
+    version = db.session.query(db.func.count(Tariff.id), db.func.max(Tariff.created_at)).one()
+    if _book is None or version != _book_version:
+        _book = TariffBook([
+            CompiledTariff(t.utility, t.effective_from, [(s.up_to, s.rate) for s in t.slabs])
+            for t in Tariff.query.options(db.selectinload(Tariff.slabs))
+        ])
+        _book_version = version
+    return _book
+
+
+def calculate_charges(entry_date, water_fill_count, previous_reading, present_reading):
+    """(water_cost, electricity_cost) under the tariffs in force on entry_date."""
+    return current_book().charges(entry_date, water_fill_count, previous_reading, present_reading)
+
+
+def entry_invoice(entry, book=None):
+    """InvoiceData for an entry, showing the tariffs in force on its date."""
+    book = book or current_book()
+    return invoice_data(entry,
+                        water_rate=book.tariff('water', entry.entry_date).describe(),
+                        electricity_rate=book.tariff('electricity', entry.entry_date).describe())
+
+
+def parse_slabs(raw):
+    """Validate [{'up_to': 100, 'rate': 10}, ..., {'up_to': None, 'rate': 15}].
+
+    Returns a list of (up_to, rate) or raises ValueError.
+    """
+    if not isinstance(raw, list) or not raw:
+        raise ValueError('slabs must be a non-empty list')
+    slabs = []
+    for slab in raw:
+        try:
+            up_to = None if slab.get('up_to') is None else float(slab['up_to'])
+            rate = float(slab['rate'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError('each slab needs a numeric rate and an up_to limit (null for the last)') from None
+        # float() accepts 'nan' and 'inf', which would price entries as NaN or Infinity
+        if not math.isfinite(rate) or (up_to is not None and not math.isfinite(up_to)):
+            raise ValueError('rates and up_to limits must be finite numbers')
+        if rate < 0:
+            raise ValueError('rates cannot be negative')
+        slabs.append((up_to, rate))
+    bounds = [up_to for up_to, _ in slabs[:-1]]
+    if slabs[-1][0] is not None or None in bounds:
+        raise ValueError('only the last slab may (and must) have up_to = null')
+    if any(b <= 0 for b in bounds) or bounds != sorted(set(bounds)):
+        raise ValueError('slab limits must be positive and strictly increasing')
+    return slabs
+
+
+def reprice(start=None, end=None, month=None, batch_size=5000):
+    """Recalculate stored water/electricity costs under the current tariffs.
+
+    Walks the matching entries in id order, `batch_size` rows at a time,
+    reading only the columns pricing needs. Each batch is priced in one pass
+    and the rows whose costs changed are written with a single executemany()
+    UPDATE. Returns (rows scanned, rows updated, seconds).
+    """
+    book = current_book()
+    started = time.perf_counter()
+    table = RentEntry.__table__
+    update = (table.update()
+              .where(table.c.id == bindparam('_id'))
+              .values(water=bindparam('_water'), electricity=bindparam('_electricity')))
+
+    query = db.select(table.c.id, table.c.entry_date, table.c.water_fill_count,
+                      table.c.electricity_previous_reading, table.c.electricity_present_reading,
+                      table.c.water, table.c.electricity).order_by(table.c.id).limit(batch_size)
+    if start:
+        query = query.where(table.c.entry_date >= start)
+    if end:
+        query = query.where(table.c.entry_date <= end)
+    if month:
+        query = query.where(table.c.month == month)
+
+    scanned = updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(query.where(table.c.id > last_id)).all()
+        if not rows:
+            break
+        changes = []
+        for entry_id, entry_date, fills, previous, present, water, electricity in rows:
+            new_water, new_electricity = book.charges(entry_date, fills, previous, present)
+            if new_water != water or new_electricity != electricity:
+                changes.append({'_id': entry_id, '_water': new_water, '_electricity': new_electricity})
+        if changes:
+            run_write(db.session.execute, update, changes)
+        else:
+            db.session.commit()
+        scanned += len(rows)
+        updated += len(changes)
+        last_id = rows[-1][0]
+
+    return scanned, updated, time.perf_counter() - started
+
+
+# --- Routes ---
+tariff_routes = Blueprint('tariffs', __name__, url_prefix='/tariffs')
+
+
+def _tariff_json(tariff):
+    return {
+        'id': tariff.id,
+        'utility': tariff.utility,
+        'effective_from': tariff.effective_from.isoformat(),
+        'name': tariff.name,
+        'slabs': [{'up_to': slab.up_to, 'rate': slab.rate} for slab in tariff.slabs],
+    }
+
+
+def _parse_date(value, field):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except (TypeError, ValueError):
+        abort(400, description=f'{field} must be a YYYY-MM-DD date')
+
+
+@tariff_routes.route('', methods=['GET'])
+def list_tariffs():
+    tariffs = Tariff.query.order_by(Tariff.utility, Tariff.effective_from)
+    return jsonify([_tariff_json(t) for t in tariffs.options(db.selectinload(Tariff.slabs))])
+
+
+@tariff_routes.route('', methods=['POST'])
+def create_tariff():
+    """Add a tariff from JSON: utility, effective_from, optional name, slabs.
+
+    Existing entries keep their stored costs until re-priced with
+    POST /tariffs/reprice.
+    """
+    data = request.get_json(silent=True) or {}
+    utility = data.get('utility')
+    if utility not in UTILITIES:
+        abort(400, description=f"utility must be one of: {', '.join(UTILITIES)}")
+    effective_from = _parse_date(data.get('effective_from'), 'effective_from')
+    if effective_from is None:
+        abort(400, description='effective_from is required')
+    try:
+        slabs = parse_slabs(data.get('slabs'))
+    except ValueError as e:
+        abort(400, description=str(e))
+    if Tariff.query.filter_by(utility=utility, effective_from=effective_from).first():
+        abort(409, description=f'A {utility} tariff already starts on {effective_from}')
+
+    tariff = Tariff(utility=utility, effective_from=effective_from, name=str(data.get('name') or ''),
+                    slabs=[TariffSlab(up_to=up_to, rate=rate) for up_to, rate in slabs])
+    run_write(db.session.add, tariff)
+    return jsonify(_tariff_json(tariff)), 201
+
+
+@tariff_routes.route('/<int:tariff_id>', methods=['DELETE'])
+def delete_tariff(tariff_id):
+    def delete():
+        db.session.delete(Tariff.query.get_or_404(tariff_id))
+
+    run_write(delete)
+    return '', 204
+
+
+@tariff_routes.route('/reprice', methods=['POST'])
+def reprice_entries():
+    """Re-price stored costs, optionally limited by month or start/end dates."""
+    values = request.get_json(silent=True) or request.values
+    scanned, updated, seconds = reprice(
+        start=_parse_date(values.get('start'), 'start'),
+        end=_parse_date(values.get('end'), 'end'),
+        month=(values.get('month') or '').strip() or None,
+    )
+    return jsonify({'scanned': scanned, 'updated': updated, 'seconds': round(seconds, 3)})
+
+
+@tariff_routes.cli.command('reprice')
+@click.option('--start', help='First entry date (YYYY-MM-DD).')
+@click.option('--end', help='Last entry date (YYYY-MM-DD).')
+@click.option('--month', help='Only entries for this month label.')
+def reprice_command(start, end, month):
+    """Recalculate stored water and electricity costs under the current tariffs."""
+    to_date = lambda value: datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    scanned, updated, seconds = reprice(start=to_date(start), end=to_date(end), month=month)
+    print(f'Re-priced {scanned} entries ({updated} changed) in {seconds:.2f}s.')
@@ -0,0 +1,137 @@
+# test_tariffs.py
+"""Worked examples for the tariff engine: slab pricing, effective dates, re-pricing.
+
+    python -m pytest -q test_tariffs.py
+"""
+
+import os
+import tempfile
+from datetime import date
+
+# The app reads these at import time: an in-memory database, and a PDF cache
+# that stays out of instance/
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('PDF_CACHE_DIR', os.path.join(tempfile.mkdtemp(prefix='rent-test-'), 'pdf_cache'))
+
+import pytest
+from sqlalchemy import event
+
+from app import app
+from models import db, init_db, RentEntry, Tariff, TariffSlab
+from tariffs import CompiledTariff, DEFAULT_RATES, TariffBook, calculate_charges, reprice
+
+# 0-20 units at 4, 20-50 at 10, everything above at 15
+SLABS = [(20, 4.0), (50, 10.0), (None, 15.0)]
+
+
+def tiered(effective_from=date(2024, 1, 1)):
+    return CompiledTariff('electricity', effective_from, SLABS)
+
+
+@pytest.mark.parametrize('units, cost', [
+    (-5, 0.0),
+    (0, 0.0),
+    (10, 40.0),                 # 10 x 4
+    (20, 80.0),                 # exactly on the first bound: all in the first slab
+    (20.5, 85.0),               # 80 + 0.5 x 10
+    (50, 380.0),                # 80 + 30 x 10, exactly on the second bound
+    (51, 395.0),                # 380 + 1 x 15
+    (100, 1130.0),              # well above the top bound: 380 + 50 x 15
+])
+def test_slab_cost(units, cost):
+    assert tiered().cost(units) == pytest.approx(cost)
+
+
+def test_slabs_are_sorted_before_compiling():
+    shuffled = CompiledTariff('electricity', date(2024, 1, 1), [SLABS[2], SLABS[0], SLABS[1]])
+    assert shuffled.cost(51) == tiered().cost(51)
+
+
+def test_single_open_slab_is_flat():
+    flat = CompiledTariff('water', date(2024, 1, 1), [(None, 300.0)])
+    assert flat.cost(3) == 900.0
+    assert flat.describe() == 'NRS 300.00/fill'
+
+
+def test_tariff_in_force_by_date():
+    june = CompiledTariff('electricity', date(2024, 6, 1), [(None, 20.0)])
+    book = TariffBook([june, tiered()])
+
+    # Before the first tariff: the original flat rate
+    assert book.tariff('electricity', date(2023, 12, 31)).cost(10) == 10 * DEFAULT_RATES['electricity']
+    # A tariff applies from its effective_from date itself
+    assert book.tariff('electricity', date(2024, 1, 1)).effective_from == date(2024, 1, 1)
+    assert book.tariff('electricity', date(2024, 5, 31)).cost(51) == 395.0
+    assert book.tariff('electricity', date(2024, 6, 1)) is june
+    assert book.tariff('electricity', date(2030, 1, 1)) is june
+    # Water has no tariffs, so it stays on the default rate
+    assert book.tariff('water', date(2024, 6, 1)).cost(2) == 2 * DEFAULT_RATES['water']
+
+
+def test_charges():
+    book = TariffBook([tiered()])
+    assert book.charges(date(2024, 2, 1), 2, 1000, 1051) == (500.0, 395.0)
+    # A present reading below the previous one bills no electricity
+    assert book.charges(date(2024, 2, 1), 0, 1000, 900) == (0.0, 0.0)
+
+
+@pytest.fixture
+def app_context():
+    with app.app_context():
+        init_db()
+        yield
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+def add_entry(entry_date, previous, present):
+    water, electricity = calculate_charges(entry_date, 1, previous, present)
+    entry = RentEntry(tenant_name='Ram', month=entry_date.strftime('%B %Y'), entry_date=entry_date,
+                      water_fill_count=1, water=water, electricity_previous_reading=previous,
+                      electricity_present_reading=present, electricity=electricity)
+    db.session.add(entry)
+    return entry
+
+
+def test_reprice_rewrites_only_changed_rows(app_context):
+    before = add_entry(date(2024, 5, 1), 1000, 1051)
+    after = [add_entry(date(2024, 6, day), 1000, 1000 + day) for day in (1, 15)]
+    db.session.add(Tariff(utility='electricity', effective_from=date(2024, 6, 1),
+                          slabs=[TariffSlab(up_to=up_to, rate=rate) for up_to, rate in SLABS]))
+    db.session.commit()
+    # Priced under the new tariff already, so re-pricing leaves it alone
+    unchanged = add_entry(date(2024, 7, 1), 1000, 1051)
+    db.session.commit()
+    assert unchanged.electricity == 395.0
+
+    updated_ids = []
+
+    @event.listens_for(db.engine, 'before_cursor_execute')
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE rent_entry'):
+            updated_ids.extend(params[-1] for params in (parameters if executemany else [parameters]))
+
+    try:
+        scanned, updated, _ = reprice()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    assert (scanned, updated) == (4, 2)
+    assert sorted(updated_ids) == sorted(entry.id for entry in after)
+    db.session.expire_all()
+    assert before.electricity == 51 * DEFAULT_RATES['electricity']
+    assert [entry.electricity for entry in after] == [4.0, 60.0]
+    assert unchanged.electricity == 395.0
+
+
+def test_reprice_by_month(app_context):
+    may, june = add_entry(date(2024, 5, 1), 0, 10), add_entry(date(2024, 6, 1), 0, 10)
+    db.session.add(Tariff(utility='electricity', effective_from=date(2024, 1, 1),
+                          slabs=[TariffSlab(up_to=None, rate=1.0)]))
+    db.session.commit()
+
+    assert reprice(month='June 2024')[:2] == (1, 1)
+    db.session.expire_all()
+    assert (may.electricity, june.electricity) == (130.0, 10.0)